@@ -0,0 +1,112 @@
+"""Worst-case MIDI handling time of the process callback under a MIDI flood.
+
+Compare queue.Queue (used before) with MidiFifo: a simulated JACK thread
+runs one cycle per block, queues incoming events for the GUI and sends
+events queued by the GUI, while a GUI thread drains and refills its side.
+
+usage: python benchmarks/midi_fifo.py [events per second] [seconds]
+"""
+
+import os
+import sys
+import threading
+import time
+from queue import Queue, Empty
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fifo import MidiFifo  # noqa: E402
+
+RATE, BLOCKSIZE = 48000, 256
+EVENT = bytes((0xB0, 7, 64))
+
+# events of a block and events read back, as in Engine.process()
+EVENTS = np.zeros(4096, dtype=MidiFifo.DTYPE)
+EVENTS['time'] = np.arange(len(EVENTS)) % BLOCKSIZE
+EVENTS['size'] = len(EVENT)
+EVENTS['data'] = np.frombuffer(EVENT, dtype=np.uint8)
+OUT_EVENTS = np.zeros(len(EVENTS), dtype=MidiFifo.DTYPE)
+
+
+def queue_cycle(queue_in, queue_out, count):
+    for i in range(count):
+        queue_in.put(EVENT)
+    try:
+        while True:
+            queue_out.get(block=False)
+    except Empty:
+        pass
+
+
+def fifo_cycle(queue_in, queue_out, count):
+    queue_in.write(EVENTS[:count])
+    while queue_out.read(OUT_EVENTS):
+        pass
+
+
+def queue_gui(queue_in, queue_out):
+    try:
+        while True:
+            queue_out.put(queue_in.get(block=False))
+    except Empty:
+        pass
+
+
+def fifo_gui(queue_in, queue_out):
+    for offset, note in queue_in:
+        queue_out.put(note)
+
+
+def run(cycle, gui, queue_in, queue_out, rate, duration):
+    period = BLOCKSIZE / RATE
+    cycles = int(duration / period)
+    times = []
+    running = True
+
+    def gui_thread():
+        while running:
+            gui(queue_in, queue_out)
+            time.sleep(0.001)
+
+    thread = threading.Thread(target=gui_thread)
+    thread.start()
+    try:
+        received = 0.0
+        start = time.perf_counter()
+        for n in range(cycles):
+            received += rate * period
+            events = int(received)
+            received -= events
+            begin = time.perf_counter()
+            cycle(queue_in, queue_out, events)
+            times.append(time.perf_counter() - begin)
+            wait = start + (n + 1) * period - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+    finally:
+        running = False
+        thread.join()
+    times.sort()
+    return times
+
+
+def main():
+    rate = float(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    print("%d events/s, %d frames blocks at %d Hz, %.0f s"
+          % (rate, BLOCKSIZE, RATE, duration))
+    for name, cycle, gui, queues in (
+            ('queue.Queue', queue_cycle, queue_gui, (Queue(), Queue())),
+            ('MidiFifo', fifo_cycle, fifo_gui, (MidiFifo(), MidiFifo()))):
+        times = run(cycle, gui, queues[0], queues[1], rate, duration)
+        print("%-12s mean %7.1f us  p99.9 %7.1f us  max %7.1f us"
+              % (name,
+                 1e6 * sum(times) / len(times),
+                 1e6 * times[int(len(times) * 0.999)],
+                 1e6 * times[-1]))
+
+
+if __name__ == '__main__':
+    main()
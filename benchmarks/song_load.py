@@ -0,0 +1,62 @@
+"""Time to open a song with its samples decoded by 1, 2, 4 and 8 workers.
+
+Without a song file, one is written to a temporary directory with
+`clips` WAV members of `seconds` of stereo noise at 48 kHz.
+
+usage: python benchmarks/song_load.py [song.sbs | clips seconds]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from io import BytesIO
+from zipfile import ZipFile
+
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clip import Clip, Song, load_song_from_file  # noqa: E402
+
+RATE = 48000
+WORKERS = (1, 2, 4, 8)
+
+
+def write_song(file_name, clips, seconds):
+    song = Song(clips, 1)
+    for x in range(clips):
+        song.addClip(Clip('clip-%02d.wav' % x), x, 0)
+    song.saveTo(file_name)
+    rng = np.random.default_rng(0)
+    with ZipFile(file_name, 'a') as zip:
+        for x in range(clips):
+            data = 0.1 * rng.standard_normal((RATE * seconds, 2))
+            buffer = BytesIO()
+            sf.write(file=buffer, data=data, samplerate=RATE,
+                     subtype='PCM_16', format='WAV')
+            zip.writestr('clip-%02d.wav' % x, buffer.getvalue())
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        if len(sys.argv) == 2:
+            file_name = sys.argv[1]
+        else:
+            clips = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+            seconds = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+            file_name = os.path.join(directory, 'song.sbs')
+            write_song(file_name, clips, seconds)
+        load_song_from_file(file_name)
+        for workers in WORKERS:
+            durations = []
+            for i in range(3):
+                start = time.perf_counter()
+                load_song_from_file(file_name, workers=workers)
+                durations.append(time.perf_counter() - start)
+            print("%d workers  %7.3f s" % (workers, min(durations)))
+
+
+if __name__ == '__main__':
+    main()
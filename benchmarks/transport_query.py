@@ -0,0 +1,50 @@
+"""Cost of reading frame, frame rate and BPM from the transport position.
+
+Compare Client.transport_query(), which builds a dict each call, with
+Client.transport_query_struct() on a preallocated position struct, as
+done by the process callback. Needs a running JACK server.
+
+usage: python benchmarks/transport_query.py [calls]
+"""
+
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jack  # noqa: E402
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    client = jack.Client("Super Boucle benchmark")
+    position = jack.position_struct()
+
+    def query_dict():
+        state, position = client.transport_query()
+        if 'beats_per_minute' in position:
+            return (position['frame'], position['frame_rate'],
+                    position['beats_per_minute'])
+
+    def query_struct():
+        state, pos = client.transport_query_struct(position)
+        if pos.valid & jack.POSITION_BBT:
+            return pos.frame, pos.frame_rate, pos.beats_per_minute
+
+    for name, query in (('transport_query', query_dict),
+                        ('transport_query_struct', query_struct)):
+        duration = min(timeit.repeat(query, number=calls, repeat=5))
+        tracemalloc.start()
+        for i in range(1000):
+            query()
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print("%-24s %6.2f us/call  peak traced memory %6d bytes"
+              % (name, 1e6 * duration / calls, peak))
+    client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,6 @@
 from PyQt5.QtWidgets import QWidget
 from cell_ui import Ui_Cell
-from clip import basename, Clip
+from clip import basename, planar, Clip
 import numpy as np
 import soundfile as sf
 
@@ -83,7 +83,7 @@ class Cell(QWidget, Ui_Cell):
         self.start_stop.setEnabled(True)
         self.clip_position.setEnabled(True)
         self.setAcceptDrops(False)
-        self.gui.song.addClip(new_clip, self.pos_x, self.pos_y)
+        self.gui.send(self.gui.song.addClip, new_clip, self.pos_x, self.pos_y)
         self.gui.update()
 
     def openClip(self):
@@ -101,8 +101,9 @@ class Cell(QWidget, Ui_Cell):
             wav_id = "%s-%02d" % (wav_id, i)
 
         data, samplerate = sf.read(audio_file, dtype=np.float32)
-        self.gui.song.data[wav_id] = data
         self.gui.song.samplerate[wav_id] = samplerate
+        self.gui.send(self.gui.song.swapData, wav_id,
+                      self.gui.song.prepareData(planar(data)))
 
         return Clip(basename(wav_id))
 
@@ -2,9 +2,14 @@ import numpy as np
 import soundfile as sf
 from PyQt5 import QtCore
 import configparser, json
-from zipfile import ZipFile
-from io import BytesIO, StringIO, TextIOWrapper
+import copy, os, struct, time, zlib
+from zipfile import ZipFile, ZipInfo, BadZipFile, ZIP_STORED, ZIP64_LIMIT
+from io import BufferedReader, BytesIO, StringIO, TextIOWrapper
+from itertools import chain
 from collections import OrderedDict as OrderedDict_
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fractions import Fraction
+from tempo import TempoMap
 import unicodedata
 
 
@@ -29,6 +34,39 @@ def basename(s):
         return str.split('/')[-1]
 
 
+# raw sample members of song files: RAW_HEADER, then float32 channel
+# planes of the audio followed by RAW_GUARD zeros, planes start on a
+# RAW_ALIGN boundary of the file so that they can be memory-mapped
+RAW_MAGIC = b'SBF32\x00\x00\x01'
+# magic, channels, samplerate, frames, guard frames
+RAW_HEADER = struct.Struct('<8sIIQQ')
+RAW_GUARD = 8192
+RAW_ALIGN = 4096
+# zip extra field padding the local header, as zipalign does
+ZIP_ALIGN_EXTRA = 0xD935
+ZIP_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+ZIP_LOCAL_MAGIC = b'PK\x03\x04'
+# general purpose flags of members followed by a data descriptor and of
+# UTF-8 member names
+ZIP_DATA_DESCRIPTOR = 0x08
+ZIP_UTF8 = 0x800
+# bytes copied at once from unchanged members of a song file
+COPY_BLOCK = 1 << 20
+
+# sample members decoded at once when loading a song
+LOAD_WORKERS = min(4, os.cpu_count() or 1)
+# frames decoded at once from a sample member, and bytes read at once
+# from the archive for the decoder
+LOAD_BLOCK = 65536
+LOAD_BUFFER = 65536
+
+
+def planar(data):
+    """Return audio read by soundfile, (frames) or (frames x channels), as
+    contiguous float32 channel planes (channels x frames)"""
+    return np.ascontiguousarray(np.atleast_2d(data.T), dtype=np.float32)
+
+
 def verify_ext(file, ext):
     if file[-4:] == (".%s" % ext):
         return file
@@ -40,6 +78,99 @@ class Communicate(QtCore.QObject):
     updateUI = QtCore.pyqtSignal()
 
 
+class ClipTable():
+    """Clip attributes stored as numpy arrays indexed by clip id
+
+    The song keeps one row per clip, in the same order as Song.clips, so the
+    audio thread can read or update every clip with array operations instead
+    of Python attribute access on each Clip.
+
+    generation is incremented on every change made outside of the audio
+    thread, so the engine knows when its active clip set is stale."""
+
+    COLUMNS = [('state', np.int8),
+               ('volume', np.float64),
+               ('frame_offset', np.int64),
+               ('beat_offset', np.float64),
+               ('beat_diviser', np.int64),
+               ('last_offset', np.int64),
+               ('mute_group', np.int64),
+               ('quantize', np.int64),
+               # index of the clip output in outputs
+               ('bus', np.int64),
+               # maintained by the engine, periods and boundaries in ticks
+               ('period', np.int64),
+               ('offset', np.int64),
+               ('boundary', np.int64),
+               # loop start and next loop boundary in frames
+               ('loop_start', np.int64),
+               ('next_boundary', np.int64),
+               # loop start kept by sync() while the next loop boundary is
+               # anchor_until, after a tempo change
+               ('anchor', np.int64),
+               ('anchor_until', np.int64)]
+
+    def __init__(self, capacity=1):
+        self.size = 0
+        self.generation = 0
+        self.outputs = []
+        for name, dtype in self.COLUMNS:
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+
+    def __len__(self):
+        return self.size
+
+    def append(self):
+        """Add a zeroed row and return its index"""
+        capacity = len(self.state)
+        if self.size == capacity:
+            for name, dtype in self.COLUMNS:
+                column = np.zeros(max(capacity * 2, 1), dtype=dtype)
+                column[:self.size] = getattr(self, name)[:self.size]
+                setattr(self, name, column)
+        row = self.size
+        self.size += 1
+        for name, dtype in self.COLUMNS:
+            getattr(self, name)[row] = 0
+        self.generation += 1
+        return row
+
+    def remove(self, row):
+        """Remove a row, rows after it are shifted down by one"""
+        for name, dtype in self.COLUMNS:
+            column = getattr(self, name)
+            column[row:self.size - 1] = column[row + 1:self.size]
+        self.size -= 1
+        self.generation += 1
+
+    def copyRow(self, row, table, table_row):
+        for name, dtype in self.COLUMNS:
+            getattr(self, name)[row] = getattr(table, name)[table_row]
+
+    def busIndex(self, output):
+        """Return the bus number of an output, new outputs are appended"""
+        if output not in self.outputs:
+            self.outputs.append(output)
+        return self.outputs.index(output)
+
+
+class ClipField:
+    """Clip attribute stored in its row of a ClipTable"""
+
+    def __init__(self, name, type):
+        self.name = name
+        self.type = type
+
+    def __get__(self, inst, cls=None):
+        if inst is None:
+            return self
+        return self.type(getattr(inst._table, self.name)[inst._row])
+
+    def __set__(self, inst, value):
+        getattr(inst._table, self.name)[inst._row] = value
+        inst._table.generation += 1
+
+
 class Clip():
     DEFAULT_OUTPUT = "Main"
 
@@ -68,11 +199,35 @@ class Clip():
                          3: "STOPPING",
                          4: "PREPARE_RECORD",
                          5: "RECORDING"}
+    # state after start() / stop(), indexed by current state
+    ON_START = np.array([STARTING, STARTING, START,
+                         START, PREPARE_RECORD, RECORDING], dtype=np.int8)
+    ON_STOP = np.array([STOP, STOP, STOPPING,
+                        STOPPING, PREPARE_RECORD, RECORDING], dtype=np.int8)
+
+    # launch quantization: at the next loop boundary (STARTING / STOPPING
+    # states), right away, at the next beat, or positive n at the next n
+    # bars, see Engine.schedule()
+    LAUNCH_LOOP = 0
+    LAUNCH_NONE = -1
+    LAUNCH_BEAT = -2
+
+    state = ClipField('state', int)
+    volume = ClipField('volume', float)
+    frame_offset = ClipField('frame_offset', int)
+    beat_offset = ClipField('beat_offset', float)
+    beat_diviser = ClipField('beat_diviser', int)
+    last_offset = ClipField('last_offset', int)
+    mute_group = ClipField('mute_group', int)
+    quantize = ClipField('quantize', int)
 
     def __init__(self, audio_file=None, name='',
                  volume=1, frame_offset=0, beat_offset=0.0, beat_diviser=1,
-                 output=DEFAULT_OUTPUT, mute_group=0):
+                 output=DEFAULT_OUTPUT, mute_group=0, quantize=LAUNCH_LOOP):
 
+        # own row until the clip is added to a song
+        self._table = ClipTable()
+        self._row = self._table.append()
         if name is '' and audio_file:
             self.name = audio_file
         else:
@@ -86,16 +241,29 @@ class Clip():
         self.last_offset = 0
         self.output = output
         self.mute_group = mute_group
+        self.quantize = quantize
 
     def stop(self):
-        self.state = Clip.STOPPING if self.state == Clip.START \
-            else Clip.STOP if self.state == Clip.STARTING \
-            else self.state
+        self.state = Clip.ON_STOP[self.state]
 
     def start(self):
-        self.state = Clip.STARTING if self.state == Clip.STOP \
-            else Clip.START if self.state == Clip.STOPPING \
-            else self.state
+        self.state = Clip.ON_START[self.state]
+
+    @property
+    def output(self):
+        return self._output
+
+    @output.setter
+    def output(self, output):
+        self._output = output
+        self._table.bus[self._row] = self._table.busIndex(output)
+
+    def attach(self, table):
+        """Move clip attributes to a new row of another table"""
+        row = table.append()
+        table.copyRow(row, self._table, self._row)
+        self._table, self._row = table, row
+        self.output = self._output
 
 
 class Song():
@@ -106,23 +274,41 @@ class Song():
         self.clips_matrix = [[None for y in range(height)]
                              for x in range(width)]
         self.clips = []
+        self.table = ClipTable(width * height)
         self.data, self.samplerate = {}, {}
+        # audio buffers followed by guard zeros, and their looped ends
+        self.padded, self.wrapped = {}, {}
+        self.guard = 0
         self.volume = 1.0
-        self.bpm = 120
+        self.tempo_map = TempoMap()
         self.beat_per_bar = 4
         self.width = width
         self.height = height
         self.file_name = None
+        # audio files changed since file_name was read or written
+        self.dirty = set()
+        # save samples as raw members, memory-mapped on load
+        self.raw_samples = False
         self.is_record = False
+        # launch quantization of scenes and transport locate
+        self.quantize = Clip.LAUNCH_LOOP
         self.outputsPorts = set()
         self.outputsPorts.add(Clip.DEFAULT_OUTPUT)
         self.scenes = OrderedDict()
         self.initial_scene = None
 
+    @property
+    def bpm(self):
+        '''Tempo at the start of the song'''
+        return self.tempo_map.points[0][1]
+
+    @bpm.setter
+    def bpm(self, bpm):
+        self.tempo_map = TempoMap(bpm)
+
     def addScene(self, name):
-        clip_ids = [i for i, c in enumerate(self.clips) if
-                    c.state == Clip.START]
-        self.scenes[name] = clip_ids
+        states = self.table.state[:len(self.clips)]
+        self.scenes[name] = np.flatnonzero(states == Clip.START).tolist()
 
     def removeScene(self, name):
         del self.scenes[name]
@@ -137,37 +323,51 @@ class Song():
         
     def loadScene(self, name):
         clip_ids = self.scenes[name]
-        self._loadScene(clip_ids)
+        self.loadSceneClips(clip_ids)
 
     def loadSceneId(self, index):
         clip_ids = list(self.scenes.values())[index]
-        self._loadScene(clip_ids)
-
-    def _loadScene(self, clip_ids):
-        for i, c in enumerate(self.clips):
-            if i in clip_ids:
-                c.start()
-            else:
-                c.stop()
+        self.loadSceneClips(clip_ids)
+
+    def loadSceneClips(self, clip_ids):
+        states = self.table.state[:len(self.clips)]
+        in_scene = np.isin(np.arange(len(states)), clip_ids)
+        states[:] = np.where(in_scene,
+                             Clip.ON_START[states],
+                             Clip.ON_STOP[states])
+        self.table.generation += 1
+
+    def _removeFromTable(self, clip):
+        row = clip._row
+        clip.attach(ClipTable())
+        self.table.remove(row)
+        del self.clips[row]
+        for c in self.clips[row:]:
+            c._row -= 1
 
     def addClip(self, clip, x, y):
         if self.clips_matrix[x][y]:
-            self.clips.remove(self.clips_matrix[x][y])
+            self._removeFromTable(self.clips_matrix[x][y])
         self.clips_matrix[x][y] = clip
+        clip.attach(self.table)
         self.clips.append(clip)
         self.outputsPorts.add(clip.output)
         clip.x = x
         clip.y = y
 
     def removeClip(self, clip):
+        '''Remove clip, return the buffers of its audio if no other clip
+        uses it'''
+        replaced = None
         if clip.audio_file is not None:
             current_audio_file = clip.audio_file
             clip.audio_file = None
             if current_audio_file not in [c.audio_file for c in self.clips]:
-                del self.data[current_audio_file]
+                replaced = self.removeData(current_audio_file)
 
         self.clips_matrix[clip.x][clip.y] = None
-        self.clips.remove(clip)
+        self._removeFromTable(clip)
+        return replaced
 
     def toggle(self, x, y):
         clip = self.clips_matrix[x][y]
@@ -178,22 +378,25 @@ class Song():
         else:
             clip.state = Clip.TRANSITION[clip.state]
             if clip.mute_group:
-                for c in self.clips:
-                    if c and c.mute_group == clip.mute_group and c != clip:
-                        c.stop()
+                count = len(self.clips)
+                group = self.table.mute_group[:count] == clip.mute_group
+                group[clip._row] = False
+                states = self.table.state[:count]
+                states[group] = Clip.ON_STOP[states[group]]
+                self.table.generation += 1
 
     def channels(self, clip):
         '''Return channel count for specified clip'''
         if clip.audio_file is None:
             return 0
         else:
-            return self.data[clip.audio_file].shape[1]
+            return self.data[clip.audio_file].shape[0]
 
     def length(self, clip):
         if clip.audio_file is None:
             return 0
         else:
-            return self.data[clip.audio_file].shape[0]
+            return self.data[clip.audio_file].shape[1]
 
     def getData(self, clip, channel, offset, length):
         if clip.audio_file is None:
@@ -207,43 +410,184 @@ class Song():
             raise Exception("Index out of range : {0} + {1} > {2}".
                             format(length, offset, self.length(clip)))
 
-        return (self.data[clip.audio_file][offset:offset + length, channel]
+        return (self.data[clip.audio_file][channel, offset:offset + length]
                 * clip.volume)
 
+    def setData(self, audio_file, data):
+        '''Store (channels x frames) audio, Song.data keeps a view of it
+        in a buffer padded with guard zeros'''
+        self.swapData(audio_file, self.prepareData(data))
+
+    def prepareData(self, data):
+        '''Build the buffers of setData() for (channels x frames) audio, so
+        that they can be swapped in later with swapData()'''
+        channels, length = data.shape
+        padded = np.zeros((channels, length + self.guard), dtype=np.float32)
+        padded[:, :length] = data
+        return self.guard, padded, self.prepareWrap(data, self.guard)
+
+    def prepareWrap(self, data, guard):
+        '''Return the index and buffer of updateWrap() for audio data'''
+        channels, length = data.shape
+        index = (np.arange(2 * guard) - guard) % max(length, 1)
+        wrapped = np.zeros((channels, 2 * guard), dtype=np.float32)
+        if length:
+            np.take(data, index, axis=1, out=wrapped)
+        return index, wrapped
+
+    def swapData(self, audio_file, buffers):
+        '''Replace audio with buffers from prepareData(), nothing is copied
+        unless the guard changed since. Return the replaced buffers.'''
+        guard, padded, wrapped = buffers
+        replaced = self.padded.get(audio_file), self.wrapped.get(audio_file)
+        length = padded.shape[1] - guard
+        if guard != self.guard:
+            buffers = self.prepareData(padded[:, :length])
+            guard, padded, wrapped = buffers
+        self.padded[audio_file] = padded
+        self.data[audio_file] = padded[:, :length]
+        self.wrapped[audio_file] = wrapped
+        self.dirty.add(audio_file)
+        return replaced
+
+    def mapData(self, audio_file, padded, length):
+        '''Use (channels x frames) audio followed by guard zeros without
+        copying it, such as read-only memory-mapped samples'''
+        if padded.shape[1] - length < self.guard:
+            guard, padded, wrapped = self.prepareData(padded[:, :length])
+        self.padded[audio_file] = padded
+        self.data[audio_file] = padded[:, :length]
+        self.wrapped.pop(audio_file, None)
+        self.updateWrap(audio_file)
+
+    def removeData(self, audio_file):
+        '''Remove audio, return its buffers'''
+        self.dirty.discard(audio_file)
+        return (self.data.pop(audio_file), self.padded.pop(audio_file),
+                self.wrapped.pop(audio_file))
+
+    def setGuard(self, guard):
+        '''Pad all audio buffers for blocks of guard frames'''
+        self.swapGuard(guard, self.prepareGuard(guard))
+
+    def prepareGuard(self, guard):
+        '''Build the buffers of setGuard(), so that they can be swapped in
+        later with swapGuard(). Buffers with enough padding are kept.'''
+        buffers = {}
+        for audio_file, data in list(self.data.items()):
+            padded = source = self.padded[audio_file]
+            length = data.shape[1]
+            if padded.shape[1] - length < guard:
+                padded = np.zeros((data.shape[0], length + guard),
+                                  dtype=np.float32)
+                padded[:, :length] = data
+            buffers[audio_file] = (source, padded,
+                                   self.prepareWrap(data, guard))
+        return buffers
+
+    def swapGuard(self, guard, buffers):
+        '''Use buffers from prepareGuard(), audio changed since is padded
+        here. Return the replaced buffers.'''
+        self.guard = guard
+        replaced = []
+        for audio_file, data in list(self.data.items()):
+            source, padded, wrapped = buffers.get(audio_file,
+                                                  (None, None, None))
+            replaced.append((self.padded[audio_file],
+                             self.wrapped.get(audio_file)))
+            if self.padded[audio_file] is not source:
+                self.mapData(audio_file, self.padded[audio_file],
+                             data.shape[1])
+                continue
+            self.padded[audio_file] = padded
+            self.data[audio_file] = padded[:, :data.shape[1]]
+            self.wrapped[audio_file] = wrapped
+        return replaced
+
+    def updateWrap(self, audio_file):
+        '''Copy audio around the loop point: the last guard frames then
+        the first guard frames, tiled when the audio is shorter'''
+        length = self.data[audio_file].shape[1]
+        if audio_file not in self.wrapped:
+            self.wrapped[audio_file] = self.prepareWrap(
+                self.data[audio_file], self.guard)
+            return
+        index, wrapped = self.wrapped[audio_file]
+        if length:
+            np.take(self.data[audio_file], index, axis=1, out=wrapped)
+
+    def readData(self, clip, out, offset):
+        '''Fill out (channels x frames) with clip audio from offset.
+
+        Nothing is allocated and the audio is one fixed-length slice of the
+        padded buffer: frames after the end of the audio are guard zeros,
+        mono audio is read once for all channels.'''
+        data = self.padded[clip.audio_file]
+        offset = min(offset, self.data[clip.audio_file].shape[1])
+        np.copyto(out, data[:out.shape[0], offset:offset + out.shape[1]])
+
+    def readLoop(self, clip, out, offset):
+        '''Like readData, but wrap to the start of the audio at its end,
+        offset must be less than the audio length'''
+        index, data = self.wrapped[clip.audio_file]
+        offset += self.guard - self.length(clip)
+        np.copyto(out, data[:out.shape[0], offset:offset + out.shape[1]])
+
+    def readIndex(self, clip, out, index):
+        '''Fill out (channels x frames) with clip audio at each position of
+        index, positions after the end of the audio read guard zeros'''
+        data = self.padded[clip.audio_file]
+        channels = min(data.shape[0], out.shape[0])
+        np.take(data[:channels], index, axis=1, out=out[:channels],
+                mode='clip')
+        out[channels:] = out[:1]
+
     def writeData(self, clip, channel, offset, data):
+        '''Copy data to clip audio channel at offset, data after the end of
+        the audio buffer is dropped. Return the number of frames written.'''
         if clip.audio_file is None:
             raise Exception("No audio buffer available")
 
-        if offset + data.shape[0] > self.length(clip):
-            data = data[0:data.shape[0] - 2]
-            # raise Exception(("attempt to write data outside of buffer"
-            #                 ": %s + %s > %s ")
-            #                % (offset, data.shape[0], self.length(clip)))
-
-        self.data[clip.audio_file][offset:offset + data.shape[0],
-        channel] = data
-        # print("Write %s bytes at offset %s to channel %s" % (data.shape[0],
-        # offset,
-        # channel))
+        audio = self.data[clip.audio_file]
+        length = max(0, min(data.shape[0], audio.shape[1] - offset))
+        audio[channel, offset:offset + length] = data[:length]
+        self.dirty.add(clip.audio_file)
+        # written frames are copied around the loop point
+        if offset < self.guard or offset + length + self.guard > len(audio[0]):
+            self.updateWrap(clip.audio_file)
+        return length
 
     def init_record_buffer(self, clip, channel, size, samplerate):
+        self.swapRecord(clip, samplerate,
+                        *self.prepareRecord(clip, channel, size))
+
+    def prepareRecord(self, clip, channel, size):
+        '''Name and build the buffer of init_record_buffer(), so that it
+        can be swapped in later with swapRecord()'''
         i = 0
         audio_file_base = basename(clip.name) or 'audio'
+        while '%s-%02d.wav' % (audio_file_base, i) in self.data:
+            i += 1
+        audio_file = '%s-%02d.wav' % (audio_file_base, i)
+        return audio_file, self.prepareData(np.zeros((channel, int(size)),
+                                                     dtype=np.float32))
+
+    def swapRecord(self, clip, samplerate, audio_file, buffers):
+        '''Give clip the buffer from prepareRecord(). Return the buffers of
+        its old audio if no other clip uses it.'''
+        replaced = None
 
         # remove old audio if not used
         if clip.audio_file is not None:
             current_audio_file = clip.audio_file
             clip.audio_file = None
             if current_audio_file not in [c.audio_file for c in self.clips]:
-                del self.data[current_audio_file]
+                replaced = self.removeData(current_audio_file)
 
-        while '%s-%02d.wav' % (audio_file_base, i) in self.data:
-            i += 1
-        audio_file = '%s-%02d.wav' % (audio_file_base, i)
-        self.data[audio_file] = np.zeros((size, channel),
-                                         dtype=np.float32)
+        self.swapData(audio_file, buffers)
         self.samplerate[audio_file] = samplerate
         clip.audio_file = audio_file
+        return replaced
 
     def save(self):
         if self.file_name:
@@ -252,48 +596,290 @@ class Song():
             raise Exception("No file specified")
 
     def saveTo(self, file):
-        with ZipFile(file, 'w') as zip:
-            song_file = configparser.ConfigParser()
-            port_list = list(self.outputsPorts)
-            song_file['DEFAULT'] = {'volume': self.volume,
-                                    'bpm': self.bpm,
-                                    'beat_per_bar': self.beat_per_bar,
-                                    'width': self.width,
-                                    'height': self.height,
-                                    'outputs': json.dumps(port_list),
-                                    'scenes': json.dumps(self.scenes)}
-            if self.initial_scene is not None:
-                song_file['DEFAULT']['initial_scene'] = self.initial_scene
-            for clip in self.clips:
-                clip_file = {'name': clip.name,
-                             'volume': str(clip.volume),
-                             'frame_offset': str(clip.frame_offset),
-                             'beat_offset': str(clip.beat_offset),
-                             'beat_diviser': str(clip.beat_diviser),
-                             'output': clip.output,
-                             'mute_group': str(clip.mute_group),
-                             'audio_file': basename(
-                                 clip.audio_file)}
-                if clip_file['audio_file'] is None:
-                    clip_file['audio_file'] = 'no-sound'
-                song_file["%s/%s" % (clip.x, clip.y)] = clip_file
-
-            buffer = StringIO()
-            song_file.write(buffer)
-            zip.writestr('metadata.ini', buffer.getvalue())
-
-            for member in self.data:
-                buffer = BytesIO()
-                sf.write(self.data[member], buffer,
-                         self.samplerate[member],
-                         subtype=sf.default_subtype('WAV'),
-                         format='WAV')
-                zip.writestr(member, buffer.getvalue())
-
+        snapshot = self.snapshot()
+        try:
+            snapshot.write(file)
+        except:
+            self.dirty |= snapshot.dirty
+            raise
         self.file_name = file
 
+    def snapshot(self):
+        '''Return a SongSnapshot of the song to save, changed samples are
+        not dirty anymore: add snapshot.dirty back if it is not written'''
+        # taken before samples are copied, so that samples recorded in
+        # between are saved or stay dirty
+        dirty, self.dirty = self.dirty, set()
+        return SongSnapshot(self, dirty)
+
+    def metadata(self):
+        '''Return the metadata.ini text of the song'''
+        song_file = configparser.ConfigParser()
+        port_list = list(self.outputsPorts)
+        song_file['DEFAULT'] = {'volume': self.volume,
+                                'bpm': self.bpm,
+                                'beat_per_bar': self.beat_per_bar,
+                                'width': self.width,
+                                'height': self.height,
+                                'outputs': json.dumps(port_list),
+                                'scenes': json.dumps(self.scenes),
+                                'quantize': self.quantize,
+                                'tempo_map': json.dumps(
+                                    [[str(beat), bpm] for beat, bpm
+                                     in self.tempo_map.points])}
+        if self.initial_scene is not None:
+            song_file['DEFAULT']['initial_scene'] = self.initial_scene
+        for clip in self.clips:
+            clip_file = {'name': clip.name,
+                         'volume': str(clip.volume),
+                         'frame_offset': str(clip.frame_offset),
+                         'beat_offset': str(clip.beat_offset),
+                         'beat_diviser': str(clip.beat_diviser),
+                         'output': clip.output,
+                         'mute_group': str(clip.mute_group),
+                         'quantize': str(clip.quantize),
+                         'audio_file': basename(
+                             clip.audio_file)}
+            if clip_file['audio_file'] is None:
+                clip_file['audio_file'] = 'no-sound'
+            song_file["%s/%s" % (clip.x, clip.y)] = clip_file
+
+        buffer = StringIO()
+        song_file.write(buffer)
+        return buffer.getvalue()
+
+
+class SongSnapshot():
+    '''Metadata and samples of a song at one time, to write the song file
+    from another thread.
+
+    Samples are the song buffers: they are replaced rather than changed,
+    except for the ones being recorded, which are copied.
+    '''
+
+    def __init__(self, song, dirty):
+        self.dirty = dirty
+        recording = {clip.audio_file for clip in song.clips
+                     if clip.state in (Clip.PREPARE_RECORD, Clip.RECORDING)}
+        self.source = song.file_name
+        self.metadata = song.metadata()
+        self.data = OrderedDict((member, data.copy()
+                                 if member in recording else data)
+                                for member, data in list(song.data.items()))
+        self.samplerate = dict(song.samplerate)
+        self.raw_samples = song.raw_samples
+
+    def write(self, file, progress=None):
+        '''Write the song to file, progress(done, total, member) is called
+        as each sample is written'''
+        # samples of the song may be mapped from file, which must not be
+        # truncated: write a new file and rename it over
+        temp_file = file + '.tmp'
+        with open(temp_file, 'wb') as temp:
+            try:
+                self._writeTo(temp, progress)
+            except:
+                temp.close()
+                os.remove(temp_file)
+                raise
+        os.replace(temp_file, file)
+
+    def _writeTo(self, file, progress):
+        # samples not changed since source was read or written are copied
+        previous = None
+        if self.source is not None:
+            try:
+                previous = ZipFile(self.source)
+            except (OSError, BadZipFile):
+                pass
+        try:
+            self._writeArchive(file, previous, progress)
+        finally:
+            if previous is not None:
+                previous.close()
+
+    def _writeArchive(self, file, previous, progress):
+        with ZipFile(file, 'w') as zip:
+            # samples first: unchanged ones keep their offsets until one
+            # before them changed, which keeps copied raw members aligned
+            for done, member in enumerate(self.data, 1):
+                if not self._copyMember(zip, previous, member):
+                    if self.raw_samples:
+                        self._writeRaw(zip, member)
+                    else:
+                        self._writeWav(zip, member)
+                if progress is not None:
+                    progress(done, len(self.data), member)
+            zip.writestr('metadata.ini', self.metadata)
+
+    def _copyMember(self, zip, previous, member):
+        '''Copy an unchanged sample member from the previous archive, byte
+        for byte, if it has the format of this save. Raw members are only
+        copied when their samples stay aligned. Return whether it was.'''
+        if previous is None or member in self.dirty:
+            return False
+        try:
+            info = previous.getinfo(member)
+        except KeyError:
+            return False
+        raw = raw_header(previous, info) is not None
+        if ((raw != self.raw_samples
+             or raw and (zip_offset(zip) - info.header_offset) % RAW_ALIGN
+             or info.flag_bits & ZIP_DATA_DESCRIPTOR)):
+            return False
+
+        def chunks(source):
+            size = (member_offset(source, info) - info.header_offset
+                    + info.compress_size)
+            source.seek(info.header_offset)
+            while size:
+                chunk = source.read(min(size, COPY_BLOCK))
+                if not chunk:
+                    raise BadZipFile("Truncated member %s" % member)
+                yield chunk
+                size -= len(chunk)
+
+        with open(self.source, 'rb') as source:
+            zip_append(zip, copy.copy(info), chunks(source))
+        return True
+
+    def _writeWav(self, zip, member):
+        buffer = BytesIO()
+        sf.write(self.data[member].T, buffer,
+                 self.samplerate[member],
+                 subtype=sf.default_subtype('WAV'),
+                 format='WAV')
+        zip.writestr(member, buffer.getvalue())
+
+    def _writeRaw(self, zip, member):
+        data = self.data[member]
+        channels, length = data.shape
+        guard = np.zeros(RAW_GUARD, dtype=np.float32)
+
+        def chunks():
+            yield RAW_HEADER.pack(RAW_MAGIC, channels,
+                                  self.samplerate[member], length, RAW_GUARD)
+            for channel in data:
+                yield np.ascontiguousarray(channel, dtype=np.float32)
+                yield guard
+
+        info = ZipInfo(member, time.localtime()[:6])
+        info.compress_type = ZIP_STORED
+        info.file_size = info.compress_size = (
+            RAW_HEADER.size + channels * (length + RAW_GUARD) * 4)
+        info.CRC = 0
+        for chunk in chunks():
+            info.CRC = zlib.crc32(chunk, info.CRC)
+        # the local header is written here, so that its extra field can
+        # be padded for planes to be aligned
+        name = member.encode('utf-8')
+        if not member.isascii():
+            info.flag_bits |= ZIP_UTF8
+        zip64 = info.file_size > ZIP64_LIMIT
+        sizes = (0xFFFFFFFF,) * 2 if zip64 else (info.file_size,) * 2
+        extra = (struct.pack('<HHQQ', 1, 16, info.file_size, info.file_size)
+                 if zip64 else b'')
+        info.extract_version = 45 if zip64 else 20
+        start = (zip_offset(zip) + ZIP_LOCAL_HEADER.size + len(name)
+                 + len(extra) + 6 + RAW_HEADER.size)
+        padding = -start % RAW_ALIGN
+        info.extra = (struct.pack('<HHH', ZIP_ALIGN_EXTRA, 2 + padding,
+                                  RAW_ALIGN) + bytes(padding))
+        year, month, day, hour, minute, second = info.date_time
+        header = ZIP_LOCAL_HEADER.pack(
+            ZIP_LOCAL_MAGIC, info.extract_version, info.flag_bits,
+            ZIP_STORED, hour << 11 | minute << 5 | second // 2,
+            (year - 1980) << 9 | month << 5 | day, info.CRC, *sizes,
+            len(name), len(extra) + len(info.extra))
+        zip_append(zip, info,
+                   chain([header, name, extra, info.extra], chunks()))
+
+
+def raw_header(zip, info):
+    '''Return channels, samplerate, frames and guard frames of a raw
+    member, or None if the member is not raw'''
+    if info.compress_type != ZIP_STORED or info.file_size < RAW_HEADER.size:
+        return None
+    with zip.open(info) as entry:
+        magic, *header = RAW_HEADER.unpack(entry.read(RAW_HEADER.size))
+    if magic != RAW_MAGIC:
+        return None
+    return header
+
 
-def load_song_from_file(file):
+def read_raw(file, zip, info):
+    '''Return (channels x frames + guard) samples of a raw member mapped
+    read-only, its frame count and samplerate, or None if the member is
+    not raw'''
+    header = raw_header(zip, info)
+    if header is None:
+        return None
+    channels, samplerate, length, guard = header
+    with open(file, 'rb') as source:
+        offset = member_offset(source, info) + RAW_HEADER.size
+    padded = np.memmap(file, dtype=np.float32, mode='r', offset=offset,
+                       shape=(channels, length + guard))
+    return padded, length, samplerate
+
+
+def member_offset(file, info):
+    '''Return the offset in file of the data of a zip member'''
+    file.seek(info.header_offset)
+    header = ZIP_LOCAL_HEADER.unpack(file.read(ZIP_LOCAL_HEADER.size))
+    name_size, extra_size = header[-2:]
+    return info.header_offset + ZIP_LOCAL_HEADER.size + name_size + extra_size
+
+
+# ZipFile cannot write a member from its local header and data, nor tell
+# where the next member starts. zip_offset() and zip_append() are the only
+# code using its private fp, filelist, NameToInfo and start_dir, the way
+# ZipFile.writestr() does in CPython 3.6 to 3.12 (tested with 3.11).
+
+def zip_offset(zip):
+    '''Return the offset of the next member written to zip'''
+    return zip.fp.tell()
+
+
+def zip_append(zip, info, chunks):
+    '''Write the chunks of a member, its local header first, at the end of
+    zip opened for writing, and add info to its central directory'''
+    info.header_offset = zip_offset(zip)
+    for chunk in chunks:
+        zip.fp.write(chunk)
+    zip.filelist.append(info)
+    zip.NameToInfo[info.filename] = info
+    zip.start_dir = zip.fp.tell()
+
+
+def read_samples(file, member, song):
+    '''Read audio of a song file member, with its own ZipFile handle so
+    that members are decoded in parallel. Return (channels x frames +
+    guard) samples, frames, samplerate and whether samples are raw.'''
+    with ZipFile(file) as zip:
+        raw = read_raw(file, zip, zip.getinfo(member))
+        if raw is not None:
+            return raw + (True,)
+        # decode from the member stream into the padded buffer by blocks
+        with BufferedReader(zip.open(member), LOAD_BUFFER) as stream, \
+                sf.SoundFile(stream) as wav:
+            padded = np.zeros((wav.channels, wav.frames + song.guard),
+                              dtype=np.float32)
+            block = np.empty((min(LOAD_BLOCK, max(wav.frames, 1)),
+                              wav.channels), dtype=np.float32)
+            length = 0
+            while length < wav.frames:
+                data = wav.read(out=block)
+                if not len(data):
+                    break
+                padded[:, length:length + len(data)] = data.T
+                length += len(data)
+            return padded, length, wav.samplerate, False
+
+
+def load_song_from_file(file, progress=None, workers=LOAD_WORKERS, guard=0):
+    '''Load a song with audio padded for blocks of guard frames, sample
+    members are read by up to workers threads and progress(done, total,
+    member) is called as each one is read'''
     with ZipFile(file) as zip:
         with zip.open('metadata.ini') as metadata_res:
             metadata = TextIOWrapper(metadata_res)
@@ -302,9 +888,17 @@ def load_song_from_file(file):
             res = Song(parser['DEFAULT'].getint('width'),
                        parser['DEFAULT'].getint('height'))
             res.file_name = file
+            res.guard = guard
             res.volume = parser['DEFAULT'].getfloat('volume', 1.0)
             res.bpm = parser['DEFAULT'].getfloat('bpm', 120.0)
+            tempo_map = parser['DEFAULT'].get('tempo_map', None)
+            if tempo_map is not None:
+                res.tempo_map = TempoMap(points=[
+                    (Fraction(beat), bpm)
+                    for beat, bpm in json.loads(tempo_map)])
             res.beat_per_bar = parser['DEFAULT'].getint('beat_per_bar', 4)
+            res.quantize = parser['DEFAULT'].getint('quantize',
+                                                    Clip.LAUNCH_LOOP)
             outputs = parser['DEFAULT'].get('outputs', '["%s"]'
                                             % Clip.DEFAULT_OUTPUT)
             res.outputsPorts = set(json.loads(outputs))
@@ -315,16 +909,20 @@ def load_song_from_file(file):
             res.initial_scene = parser['DEFAULT'].get('initial_scene', None)
 
             # Loading wavs
-            for member in zip.namelist():
-                if member == 'metadata.ini':
-                    continue
-                buffer = BytesIO()
-                wav_res = zip.open(member)
-                buffer.write(wav_res.read())
-                buffer.seek(0)
-                data, samplerate = sf.read(buffer, dtype=np.float32)
-                res.data[member] = data
+            members = [member for member in zip.namelist()
+                       if member != 'metadata.ini']
+            with ThreadPoolExecutor(max(1, workers)) as executor:
+                futures = {executor.submit(read_samples, file, member, res):
+                           member for member in members}
+                for done, future in enumerate(as_completed(futures), 1):
+                    future.result()
+                    if progress is not None:
+                        progress(done, len(members), futures[future])
+            for future, member in futures.items():
+                padded, length, samplerate, raw = future.result()
+                res.mapData(member, padded, length)
                 res.samplerate[member] = samplerate
+                res.raw_samples |= raw
 
             # loading clips
             for section in parser:
@@ -343,7 +941,9 @@ def load_song_from_file(file):
                             parser[section].getfloat('beat_offset', 0.0),
                             parser[section].getint('beat_diviser'),
                             parser[section].get('output', Clip.DEFAULT_OUTPUT),
-                            parser[section].getint('mute_group', 0))
+                            parser[section].getint('mute_group', 0),
+                            parser[section].getint('quantize',
+                                                   Clip.LAUNCH_LOOP))
                 res.addClip(clip, x, y)
 
     return res
@@ -17,11 +17,13 @@ class DeviceOutput:
     def __set__(self, inst, value):
         mapping = self.get_mapping(inst)
         mapping[self.name] = value
+        inst.version += 1
         # inst.update_lookup()
 
     def __delete__(self, inst):
         mapping = self.get_mapping(inst)
         del mapping[self.name]
+        inst.version += 1
         # inst.update_lookup()
 
 
@@ -33,6 +35,9 @@ class DeviceInput(DeviceOutput):
 
 
 class Device:
+    # changes of the mapping, for the engine to map pads again
+    version = 0
+
     def __init__(self, mapping=None):
         if mapping is None:
             self.updateMapping({})
@@ -46,6 +51,7 @@ class Device:
             line = self.start_stop[y]
             for x in range(len(line)):
                 self.note_to_coord[tuple(line[x])] = (x, y)
+        self.version += 1
 
     def generateNote(self, x, y, state):
         (msg_type, channel, pitch, velocity) = self.start_stop[y][x]
@@ -0,0 +1,684 @@
+"""Audio engine rendering the song to JACK ports from the process callback."""
+
+import heapq
+import jack
+import numpy as np
+from collections import deque
+from clip import Clip, Song
+from fifo import MidiFifo
+
+# state after a loop boundary, indexed by current state
+CLIP_TRANSITION = np.array([Clip.STOP,
+                            Clip.START,  # STARTING
+                            Clip.START,
+                            Clip.STOP,  # STOPPING
+                            Clip.RECORDING,  # PREPARE_RECORD
+                            Clip.STOP],  # RECORDING
+                           dtype=np.int8)
+
+
+class Snapshot():
+    '''Engine state shown by the GUI, see Engine.publish()'''
+
+    def __init__(self):
+        self.count = 0
+        self.states = np.zeros(0, dtype=np.int8)
+        self.last_offsets = np.zeros(0, dtype=np.int64)
+        self.rolling = False
+        self.frame = self.frame_rate = 0
+        # (bar, beat, tick) or None
+        self.bbt = None
+        # output peak of each bus channel, with master volume
+        self.peaks = np.zeros((0, len(Song.CHANNEL_NAMES)), dtype=np.float32)
+        # changes of clip states, to redraw clips
+        self.updates = 0
+
+    def copy(self, other):
+        '''Copy other snapshot, reusing arrays when large enough'''
+        count = other.count
+        if len(self.states) < count:
+            self.states = np.zeros_like(other.states)
+            self.last_offsets = np.zeros_like(other.last_offsets)
+        if self.peaks.shape != other.peaks.shape:
+            self.peaks = np.zeros_like(other.peaks)
+        self.count = count
+        np.copyto(self.states[:count], other.states[:count])
+        np.copyto(self.last_offsets[:count], other.last_offsets[:count])
+        np.copyto(self.peaks, other.peaks)
+        self.rolling, self.frame = other.rolling, other.frame
+        self.frame_rate, self.bbt = other.frame_rate, other.bbt
+        self.updates = other.updates
+
+
+class Engine():
+    '''Mix all playing clips of a block with a handful of numpy calls.
+
+    Every audible clip slice of the block is gathered in one slot of a
+    preallocated (slots x channels x frames) work array. The work array is
+    then reduced into one (buses x channels x frames) array by a single
+    matrix product with the (slots x buses) gain matrix, which routes each
+    slot to its bus and applies clip volume in the same pass. Master volume
+    is applied while copying buses to their JACK ports, unused buses only
+    clear their ports.
+
+    Audio is read as fixed-length slices of buffers padded with at least
+    one block of zeros. The GUI pads them again when the blocksize grows,
+    see Gui.updateGuard().
+
+    Only clips in the active set (any state but STOP) are looked at. Each of
+    them keeps the absolute frame of its next loop boundary, advanced by
+    exact periods past the block. Periods and offsets are cached in integer
+    ticks when clips or the segment of the song tempo map change, and
+    boundaries are only searched again after a transport relocate. Tempo
+    changes apply from the first block starting after them: boundaries
+    move to the beats of the new tempo while playing clips go on from
+    where they are. Loops shorter than a block are read
+    through an index of clip positions, built with a few array operations.
+
+    Clip pad presses of the current device are handled here rather than in
+    the GUI: clips are toggled at the frame of the press. Clips with a
+    launch quantization, scenes and locates of the song quantization are
+    scheduled on the beat grid and run at their frame in block, see
+    schedule().
+
+    Nothing here calls Qt. MIDI goes through FIFOs and at the end of each
+    cycle the state to display is published in one of two snapshots,
+    which the GUI polls with read_state(). The GUI changes clips and audio
+    buffers with send(): commands are applied together at the start of a
+    cycle, new buffers are built by the GUI and only swapped in here.
+    '''
+
+    def __init__(self, client, gui, midi_in, midi_out, inL, inR):
+        self.client = client
+        self.gui = gui
+        self.midi_in, self.midi_out = midi_in, midi_out
+        self.inL, self.inR = inL, inR
+        self.work = np.zeros((0, len(Song.CHANNEL_NAMES), 0),
+                             dtype=np.float32)
+        self.gains = np.zeros((0, 0), dtype=np.float32)
+        self.bus = np.zeros((0, len(Song.CHANNEL_NAMES), 0),
+                            dtype=np.float32)
+        self.bus_used = np.zeros(0, dtype=bool)
+        self.ramp = np.zeros(0, dtype=np.int64)
+        self.index = np.zeros(0, dtype=np.int64)
+        # clips not in STOP state, see sync()
+        self.table, self.generation = None, None
+        self.active = np.zeros(0, dtype=np.intp)
+        self.next_frame = self.segment = None
+        self.ticks = 1
+        # clip pads of the device, see update_pads()
+        self.device, self.device_version = None, None
+        self.pads, self.forward = {}, set()
+        self.pad_mask = np.zeros((256, 256), dtype=bool)
+        self.launches = []
+        # heap of (frame, order, action, args), see schedule()
+        self.scheduled = []
+        self.order = 0
+        # order of the scheduled toggle of clips
+        self.pending = {}
+        # audible (begin, end) frames of clips started or stopped in block
+        self.gates = {}
+        self.stopped = []
+        self.rolling = False
+        self.midi_events = np.zeros(1024, dtype=MidiFifo.DTYPE)
+        # transport position of the cycle, filled without allocating
+        self.position = jack.position_struct()
+        # published snapshot is snapshots[sequence % 2]
+        self.snapshots = (Snapshot(), Snapshot())
+        self.sequence = 0
+        self.updates = 0
+        self.peaks = np.zeros((0, len(Song.CHANNEL_NAMES)), dtype=np.float32)
+        # (function, args) from the GUI, and what they replaced, which is
+        # released by the GUI rather than freed in the process callback
+        self.commands, self.released = deque(), deque()
+
+    def allocate(self, slots, buses, frames):
+        '''Grow work arrays, only happens when clips, ports or the
+        blocksize change'''
+        channels = len(Song.CHANNEL_NAMES)
+        if slots > self.work.shape[0] or frames != self.work.shape[2]:
+            self.work = np.zeros((slots, channels, frames), dtype=np.float32)
+        if slots > self.gains.shape[0] or buses != self.gains.shape[1]:
+            self.gains = np.zeros((slots, buses), dtype=np.float32)
+        if buses != self.bus.shape[0] or frames != self.bus.shape[2]:
+            self.bus = np.zeros((buses, channels, frames), dtype=np.float32)
+            self.bus_used = np.zeros(buses, dtype=bool)
+            self.peaks = np.zeros((buses, channels), dtype=np.float32)
+        if frames != len(self.ramp):
+            self.ramp = np.arange(frames, dtype=np.int64)
+            self.index = np.zeros(frames, dtype=np.int64)
+
+    def update_timing(self, table, segment):
+        '''Cache clip period and offset as integer ticks of a tempo segment
+
+        A tick is 1 / numerator of the bpm fraction of a frame, so a beat
+        (60 * fps / bpm frames) is a whole number of ticks and loop
+        boundaries are computed exactly, without drift. Offsets are moved
+        by the tick of frame 0, so that boundaries are on beats of the
+        tempo map rather than of frame 0 at this tempo.'''
+        self.ticks = segment.ticks
+        ticks_per_beat = segment.ticks_per_beat
+        count = len(table)
+        table.period[:count] = table.beat_diviser[:count] * ticks_per_beat
+        table.offset[:count] = (table.frame_offset[:count] * self.ticks
+                                + np.round(table.beat_offset[:count]
+                                           * ticks_per_beat)
+                                - segment.tick_base)
+
+    def sync(self, table, rows, frame):
+        '''Find the first loop boundary of clips at or after frame, clips
+        anchored up to that boundary keep their loop start'''
+        period, offset = table.period[rows], table.offset[rows]
+        table.boundary[rows] = offset - ((offset - frame * self.ticks)
+                                         // period) * period
+        self.set_boundaries(table, rows)
+        anchored = table.anchor_until[rows] == table.next_boundary[rows]
+        table.loop_start[rows] = np.where(anchored, table.anchor[rows],
+                                          table.loop_start[rows])
+
+    def set_boundaries(self, table, rows):
+        '''Round loop boundaries to the first frame after them'''
+        boundary = table.boundary[rows]
+        table.next_boundary[rows] = -(-boundary // self.ticks)
+        table.loop_start[rows] = -((table.period[rows] - boundary)
+                                   // self.ticks)
+
+    def loop_index(self, table, row, start, frame):
+        '''Return clip positions from frame start of the block to its end,
+        following every loop boundary of the clip on the way'''
+        index = self.index[:len(self.ramp) - start]
+        # ticks since the last boundary, modulo the period, in frames
+        np.multiply(self.ramp[:len(index)], self.ticks, out=index)
+        index += (frame + start) * self.ticks - table.boundary[row]
+        np.remainder(index, table.period[row], out=index)
+        np.floor_divide(index, self.ticks, out=index)
+        return index
+
+    def update_pads(self, device):
+        '''Map raw MIDI events of the device clip pads to their (x, y)
+
+        Events of controls Gui.processNote handles before the pads are
+        kept in forward, for the GUI.'''
+        self.device, self.device_version = device, device.version
+        self.pads, self.forward = {}, set()
+        # status and first data byte of pad events
+        self.pad_mask[:] = False
+
+        def key(msg_type, channel, pitch, velocity=-1):
+            status = (msg_type << 4) + channel
+            if velocity == -1:
+                return bytes((status, pitch))
+            return bytes((status, pitch, velocity))
+
+        buttons = [device.play_btn, device.pause_btn, device.rewind_btn,
+                   device.goto_btn, device.record_btn]
+        for btn in (buttons + device.scene_buttons
+                    + device.block_buttons):
+            if btn:
+                self.forward.add(key(*btn))
+        for ctrl in device.ctrls + [device.master_volume_ctrl]:
+            if ctrl:
+                self.forward.add(key(*ctrl))
+        for btn, coord in device.note_to_coord.items():
+            self.pads[key(*btn)] = coord
+            self.pad_mask[key(*btn)[0], key(*btn)[1]] = True
+
+    def dispatch(self, song, events):
+        '''Keep clip pad presses for launch(), return the other events
+
+        Only events starting like a pad event are looked at one by one.'''
+        if song.is_record or not len(events):
+            return events
+        pads, forward = self.pads, self.forward
+        data = events['data']
+        pressed = (self.pad_mask[data[:, 0], data[:, 1]]
+                   & (events['size'] == 3))
+        for j in np.flatnonzero(pressed):
+            event = data[j].tobytes()
+            coord = None
+            if event not in forward and event[:2] not in forward:
+                coord = pads.get(event, pads.get(event[:2]))
+            if coord is None:
+                pressed[j] = False
+            else:
+                self.launches.append((int(events['time'][j]), coord))
+        return events[~pressed]
+
+    def launch(self, song, frame=None):
+        '''Toggle clips of the pads pressed in the block, at the frame of
+        the press. Return clips to toggle once the block loop boundaries
+        are done, as their boundary in block comes before the press.'''
+        table = song.table
+        later = []
+        for offset, (x, y) in self.launches:
+            try:
+                clip = song.clips_matrix[x][y]
+            except IndexError:
+                continue
+            if clip is None:
+                continue
+            if frame is not None and clip.quantize != Clip.LAUNCH_LOOP:
+                self.queue_clip(song, clip, frame + offset)
+                continue
+            row = clip._row
+            stopped = table.state[row] == Clip.STOP
+            if ((frame is not None and not stopped
+                 and table.next_boundary[row] < frame + offset)):
+                later.append((x, y))
+                continue
+            song.toggle(x, y)
+            # first loop starts at or after the press
+            if frame is not None and stopped:
+                self.sync(table, [row], frame + offset)
+        del self.launches[:]
+        return later
+
+    def schedule(self, frame, action, *args):
+        '''Call action(song, offset, *args) in the block of frame, offset
+        being the frame in block. Actions are run from the JACK thread in
+        frame order, after a relocate all of them run at once.'''
+        self.order += 1
+        heapq.heappush(self.scheduled, (frame, self.order, action, args))
+
+    def run_schedule(self, song, frame, frames, relocated):
+        '''Run actions due in the block, return True if any'''
+        scheduled = self.scheduled
+        ran = False
+        while scheduled and (relocated or scheduled[0][0] < frame + frames):
+            target, order, action, args = heapq.heappop(scheduled)
+            action(song, 0 if relocated else max(target - frame, 0), *args)
+            ran = True
+        return ran
+
+    def launch_frame(self, song, frame, quantize):
+        '''Return the first frame at or after frame on the launch grid,
+        counted in beats of the tempo map from the song start'''
+        if quantize == Clip.LAUNCH_BEAT:
+            beats = 1
+        elif quantize > 0:
+            beats = quantize * song.beat_per_bar
+        else:
+            return frame
+        segment = song.tempo_map.segment(frame, self.position.frame_rate)
+        step = beats * segment.ticks_per_beat
+        tick = frame * segment.ticks + segment.tick_base
+        tick = -(-tick // step) * step
+        return -(-(tick - segment.tick_base) // segment.ticks)
+
+    def start_clips(self, song, offset, clips):
+        '''Start clips at offset in block, where they would be in their
+        loop if they had been playing'''
+        table = song.table
+        for clip in clips:
+            if clip._table is not table:
+                continue
+            row = clip._row
+            state = table.state[row]
+            if state == Clip.STOP or state == Clip.STARTING:
+                table.state[row] = Clip.START
+                self.sync(table, [row], self.position.frame)
+                self.gates[row] = offset, None
+            elif state == Clip.STOPPING:
+                table.state[row] = Clip.START
+            elif state == Clip.START and row in self.stopped:
+                self.stopped.remove(row)
+                del self.gates[row]
+
+    def stop_clips(self, song, offset, clips):
+        '''Stop clips at offset in block'''
+        table = song.table
+        for clip in clips:
+            if clip._table is not table:
+                continue
+            row = clip._row
+            state = table.state[row]
+            if state == Clip.START or state == Clip.STOPPING:
+                begin, end = self.gates.get(row, (0, None))
+                self.gates[row] = begin, max(begin, offset)
+                self.stopped.append(row)
+            elif state == Clip.STARTING:
+                table.state[row] = Clip.STOP
+
+    def queue_clip(self, song, clip, frame):
+        '''Start or stop clip at the launch grid of the clip after frame,
+        a second toggle before cancels it'''
+        if self.pending.pop(clip, None) is not None:
+            return
+        start = clip.state == Clip.STOP or clip.state == Clip.STARTING
+        self.pending[clip] = order = self.order + 1
+        self.schedule(self.launch_frame(song, frame, clip.quantize),
+                      self.toggle_clip, clip, start, order)
+
+    def toggle_clip(self, song, offset, clip, start, order):
+        if self.pending.get(clip) != order:
+            return
+        del self.pending[clip]
+        if not start:
+            self.stop_clips(song, offset, [clip])
+            return
+        if clip.mute_group:
+            self.stop_clips(song, offset,
+                            [other for other in song.clips
+                             if other.mute_group == clip.mute_group
+                             and other is not clip])
+        self.start_clips(song, offset, [clip])
+
+    def queue_scene(self, song, clip_ids):
+        '''Load scene clips at the song launch grid, from the GUI with
+        send()'''
+        if not self.rolling or song.quantize == Clip.LAUNCH_LOOP:
+            song.loadSceneClips(clip_ids)
+            self.updates += 1
+            return
+        self.schedule(self.launch_frame(song, self.position.frame,
+                                        song.quantize),
+                      self.load_scene, clip_ids)
+
+    def load_scene(self, song, offset, clip_ids):
+        clips = song.clips
+        self.stop_clips(song, offset, [clip for i, clip in enumerate(clips)
+                                       if i not in clip_ids])
+        self.start_clips(song, offset, [clips[i] for i in clip_ids
+                                        if i < len(clips)])
+
+    def queue_locate(self, song, frame):
+        '''Relocate the transport at the song launch grid, from the GUI
+        with send(). JACK moves at the start of a cycle, so the rest of
+        the block of the grid frame plays on.'''
+        if not self.rolling or song.quantize == Clip.LAUNCH_LOOP:
+            self.client.transport_locate(frame)
+            return
+        self.schedule(self.launch_frame(song, self.position.frame,
+                                        song.quantize),
+                      self.locate, frame)
+
+    def locate(self, song, offset, frame):
+        self.client.transport_locate(frame)
+
+    def send(self, function, *args):
+        '''Call function(*args) at the start of the next cycle, from the GUI
+        thread. A value returned by function is kept in released.'''
+        self.commands.append((function, args))
+
+    def apply_commands(self):
+        '''Apply commands queued when the cycle starts, the GUI redraws
+        clips after them'''
+        commands = self.commands
+        count = len(commands)
+        for i in range(count):
+            function, args = commands.popleft()
+            replaced = function(*args)
+            if replaced is not None:
+                self.released.append(replaced)
+        if count:
+            self.updates += 1
+
+    def publish(self, table, count, rolling):
+        '''Write the cycle state in the snapshot not shown, then show it'''
+        snapshot = self.snapshots[(self.sequence + 1) % 2]
+        if len(snapshot.states) < count:
+            snapshot.states = np.zeros(len(table.state), dtype=np.int8)
+            snapshot.last_offsets = np.zeros(len(table.state),
+                                             dtype=np.int64)
+        if snapshot.peaks.shape != self.peaks.shape:
+            snapshot.peaks = np.zeros_like(self.peaks)
+        snapshot.count = count
+        np.copyto(snapshot.states[:count], table.state[:count])
+        np.copyto(snapshot.last_offsets[:count], table.last_offset[:count])
+        np.copyto(snapshot.peaks, self.peaks)
+        position = self.position
+        snapshot.rolling = rolling
+        snapshot.frame = position.frame
+        snapshot.frame_rate = position.frame_rate
+        if position.valid & jack.POSITION_BBT:
+            snapshot.bbt = position.bar, position.beat, position.tick
+        else:
+            snapshot.bbt = None
+        snapshot.updates = self.updates
+        self.sequence += 1
+
+    def read_state(self, snapshot):
+        '''Copy the last published state in snapshot, from the GUI thread.
+
+        Return False if the engine published twice while copying.'''
+        for attempt in range(3):
+            sequence = self.sequence
+            snapshot.copy(self.snapshots[sequence % 2])
+            if self.sequence == sequence:
+                return True
+        return False
+
+    def process(self, frames):
+        gui = self.gui
+        song = gui.song
+        client = self.client
+        state, position = client.transport_query_struct(self.position)
+        self.rolling = bool(state == jack.ROLLING
+                            and position.valid & jack.POSITION_BBT
+                            and position.frame_rate != 0)
+
+        inL_buffer = self.inL.get_array(frames)
+        inR_buffer = self.inR.get_array(frames)
+
+        self.apply_commands()
+        self.allocate(len(song.clips), len(song.table.outputs), frames)
+        # audio is padded by the GUI, clips are silent until it is done
+        padded = song.guard >= frames
+        work, gains, bus_used = self.work, self.gains, self.bus_used
+        bus_used[:] = False
+        slots = 0
+
+        # check midi in
+        count = self.midi_in.read_midi_events(self.midi_events)
+        events = self.midi_events[:count]
+        if gui.is_learn_device_mode:
+            gui.learn_device.queue.write(events)
+        else:
+            if ((gui.device is not self.device
+                 or gui.device.version != self.device_version)):
+                self.update_pads(gui.device)
+            gui.queue_in.write(self.dispatch(song, events))
+        self.midi_out.clear_buffer()
+
+        if self.rolling:
+            frame = position.frame
+            table = song.table
+            segment = song.tempo_map.segment(frame, position.frame_rate)
+            relocated = frame != self.next_frame
+
+            # clips or tempo changed
+            kept = None
+            if ((table is not self.table
+                 or table.generation != self.generation
+                 or segment is not self.segment)):
+                # new tempo while rolling, clips go on where they are,
+                # even if clips changed in the same block
+                if ((table is self.table and segment is not self.segment
+                     and frame == self.next_frame)):
+                    kept = self.active, table.loop_start[self.active]
+                self.table, self.generation = table, table.generation
+                self.segment = segment
+                self.update_timing(table, segment)
+                self.active = np.flatnonzero(
+                    table.state[:len(song.clips)] != Clip.STOP)
+                self.next_frame = None
+            # transport relocated
+            if frame != self.next_frame:
+                self.sync(table, self.active, frame)
+                # anchored until their next boundary, so that later syncs
+                # of the loop do not move them to the new beats
+                if kept is not None:
+                    rows, loop_start = kept
+                    # clips stopped or removed meanwhile
+                    playing = ((rows < len(song.clips))
+                               & (table.state[rows] != Clip.STOP))
+                    rows, loop_start = rows[playing], loop_start[playing]
+                    table.anchor[rows] = table.loop_start[rows] = loop_start
+                    table.anchor_until[rows] = table.next_boundary[rows]
+            self.next_frame = frame + frames
+
+            later = []
+            if self.launches:
+                later = self.launch(song, frame)
+                self.active = np.flatnonzero(
+                    table.state[:len(song.clips)] != Clip.STOP)
+                self.updates += 1
+
+            # scheduled launches, clips are gated at their frame in block
+            gates = self.gates
+            if self.scheduled:
+                if self.run_schedule(song, frame, frames, relocated):
+                    self.active = np.flatnonzero(
+                        table.state[:len(song.clips)] != Clip.STOP)
+                    self.updates += 1
+
+            active = self.active
+            states = table.state[active]
+            last_offset = table.last_offset
+            # position in the clip about to be played
+            clip_offset = frame - table.loop_start[active]
+            # first frame of the next loop in block (or after it)
+            split = np.minimum(table.next_boundary[active] - frame, frames)
+            # loop boundaries in block, short loops can have several
+            wraps = np.maximum((frame + frames - 1) * self.ticks
+                               - table.boundary[active], -1)
+            wraps //= table.period[active]
+            wraps += 1
+            due = wraps > 0
+            render = due | ((states != Clip.STARTING)
+                            & (states != Clip.PREPARE_RECORD))
+
+            for j in np.flatnonzero(render):
+                i = active[j]
+                clip = song.clips[i]
+                clip_state = states[j]
+                offset = int(clip_offset[j])
+                next_offset = int(split[j])
+
+                if clip_state == Clip.RECORDING:
+                    song.writeData(clip, 0, offset, inL_buffer[:next_offset])
+                    song.writeData(clip, 1, offset, inR_buffer[:next_offset])
+                    last_offset[i] = offset
+
+                elif clip_state == Clip.PREPARE_RECORD:
+                    song.writeData(clip, 0, 0, inL_buffer[next_offset:])
+                    song.writeData(clip, 1, 0, inR_buffer[next_offset:])
+
+                elif clip.audio_file is not None and padded:
+                    out = work[slots]
+                    if not due[j]:
+                        song.readData(clip, out, offset)
+                        last_offset[i] = offset
+                    # loop shorter than the block, read by position
+                    elif wraps[j] > 1 and clip_state != Clip.STOPPING:
+                        if clip_state == Clip.STARTING:
+                            out[:, :next_offset] = 0
+                        else:
+                            song.readData(clip, out[:, :next_offset], offset)
+                        song.readIndex(clip, out[:, next_offset:],
+                                       self.loop_index(table, i, next_offset,
+                                                       frame))
+                        last_offset[i] = 0
+                    # loop ends with the audio, read through the wrap copy
+                    elif (clip_state == Clip.START
+                          and offset + next_offset == song.length(clip)):
+                        song.readLoop(clip, out, offset)
+                        last_offset[i] = 0
+                    else:
+                        current, following = (out[:, :next_offset],
+                                              out[:, next_offset:])
+                        # end of the current loop
+                        if clip_state == Clip.STARTING:
+                            current.fill(0)
+                        else:
+                            song.readData(clip, current, offset)
+                        # start of the next loop
+                        if clip_state != Clip.STOPPING:
+                            song.readData(clip, following, 0)
+                        else:
+                            following.fill(0)
+                        last_offset[i] = 0
+                    if i in gates:
+                        begin, end = gates[i]
+                        out[:, :begin] = 0
+                        if end is not None:
+                            out[:, end:] = 0
+                    bus = table.bus[i]
+                    gains[slots] = 0
+                    gains[slots, bus] = table.volume[i]
+                    bus_used[bus] = True
+                    slots += 1
+
+            # starting or stopping clips
+            if due.any():
+                rows, old_states = active[due], states[due]
+                new_states = CLIP_TRANSITION[old_states]
+                # a second boundary in block completes the transition
+                twice = wraps[due] > 1
+                new_states[twice] = CLIP_TRANSITION[new_states[twice]]
+                changed = rows[new_states != old_states]
+                # reset record offset
+                recorded = rows[(old_states == Clip.RECORDING)
+                                | (twice
+                                   & (old_states == Clip.PREPARE_RECORD))]
+                table.frame_offset[recorded] = 0
+                last_offset[changed] = 0
+                table.state[rows] = new_states
+                table.boundary[rows] += table.period[rows] * wraps[due]
+                self.set_boundaries(table, rows)
+                if len(changed):
+                    self.active = active[table.state[active] != Clip.STOP]
+                    self.updates += 1
+
+            # pads pressed after the loop boundary of their clip
+            if later:
+                for x, y in later:
+                    song.toggle(x, y)
+                self.active = np.flatnonzero(
+                    table.state[:len(song.clips)] != Clip.STOP)
+                self.updates += 1
+
+            # clips stopped by the schedule in block
+            if self.stopped:
+                table.state[self.stopped] = Clip.STOP
+                del self.stopped[:]
+                self.active = np.flatnonzero(
+                    table.state[:len(song.clips)] != Clip.STOP)
+                self.updates += 1
+            gates.clear()
+
+        # stopped transport, toggle clips right away
+        if self.launches:
+            self.launch(song)
+            self.updates += 1
+
+        # mix all slots into buses, with clip volume
+        bus = self.bus
+        if slots:
+            np.dot(gains[:slots].T, work[:slots].reshape(slots, -1),
+                   out=bus.reshape(bus.shape[0], -1))
+
+        # copy to ports with master volume
+        peaks = self.peaks
+        peaks[:] = 0
+        for i, ports in enumerate(gui.bus_ports):
+            for ch_id, port in enumerate(ports):
+                if port is None:
+                    continue
+                buffer = port.get_array(frames)
+                if i < len(bus_used) and bus_used[i]:
+                    np.multiply(bus[i, ch_id], song.volume, out=buffer)
+                    peaks[i, ch_id] = max(buffer.max(), -buffer.min())
+                else:
+                    buffer.fill(0)
+
+        # events not fitting in the port buffer are sent next cycle, one
+        # not written in the empty buffer never will be and is dropped
+        count = gui.queue_out.peek(self.midi_events)
+        if count:
+            written = self.midi_out.write_midi_events(
+                self.midi_events[:count])
+            gui.queue_out.advance(max(written, 1))
+
+        self.publish(song.table, len(song.clips), state == jack.ROLLING)
+        return jack.CALL_AGAIN
@@ -0,0 +1,69 @@
+"""Lock-free MIDI event FIFO between the JACK thread and the GUI."""
+
+import struct
+import jack
+
+
+class MidiFifo():
+    '''Fixed-size FIFO of short MIDI events over a JACK ringbuffer.
+
+    Each event is stored as one fixed-size record: its frame offset in
+    the JACK block, its size and up to 3 bytes of data. Records have the
+    layout of jack.midi_event_dtype() arrays, so whole arrays of events
+    go in and out with read() and write(). There must be only one writer
+    thread and one reader thread. When the FIFO is full, new events are
+    dropped and counted in dropped.
+    '''
+    HEADER = struct.Struct('=IB')
+    EVENT = struct.Struct('=IB3s')
+    DATA_SIZE = 3
+    RECORD_SIZE = EVENT.size
+    DTYPE = jack.midi_event_dtype(DATA_SIZE)
+
+    def __init__(self, size=4096):
+        self.buffer = jack.RingBuffer(size * self.RECORD_SIZE)
+        self.record = bytearray(self.RECORD_SIZE)
+        self.dropped = 0
+
+    def put(self, data, offset=0):
+        '''Queue event data (bytes or ints) at frame offset, events longer
+        than 3 bytes are dropped. Return True if the event was queued.'''
+        size = len(data)
+        if ((size > self.DATA_SIZE
+             or self.buffer.write_space < self.RECORD_SIZE)):
+            self.dropped += 1
+            return False
+        record = self.record
+        self.HEADER.pack_into(record, 0, offset, size)
+        record[self.HEADER.size:self.HEADER.size + size] = data
+        self.buffer.write(record)
+        return True
+
+    def write(self, events):
+        '''Queue an array of events with one ringbuffer write, return the
+        number of events queued'''
+        count = self.buffer.write_from(events)
+        self.dropped += len(events) - count
+        return count
+
+    def read(self, events):
+        '''Move queued events to the start of an array, return their
+        number'''
+        return self.buffer.read_into(events)
+
+    def peek(self, events):
+        '''Copy queued events to the start of an array and keep them
+        queued, return their number'''
+        return self.buffer.peek_into(events)
+
+    def advance(self, count):
+        '''Remove count events copied with peek()'''
+        self.buffer.read_advance(count * self.RECORD_SIZE)
+
+    def __iter__(self):
+        '''Iterate over the events queued so far, read all at once'''
+        count = self.buffer.read_space // self.RECORD_SIZE
+        if count:
+            records = self.buffer.read(count * self.RECORD_SIZE)
+            for offset, size, data in self.EVENT.iter_unpack(records):
+                yield offset, data[:size]
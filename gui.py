@@ -5,7 +5,8 @@
 Gui
 """
 from PyQt5.QtWidgets import (QMainWindow, QFileDialog,
-                             QAction, QActionGroup, QMessageBox, QApplication)
+                             QAction, QActionGroup, QMessageBox, QApplication,
+                             QProgressDialog)
 from PyQt5.QtCore import QTimer, QObject, pyqtSignal, QSettings, Qt
 from clip import Clip, load_song_from_file, verify_ext, Song
 from gui_ui import Ui_MainWindow
@@ -19,17 +20,17 @@ from new_song import NewSongDialog
 from add_clip import AddClipDialog
 from add_port import AddPortDialog
 from device import Device
+from fifo import MidiFifo
+from engine import Snapshot
+from tempo import Tempo
 import struct
-from queue import Queue, Empty
 import pickle
 from os.path import expanduser, dirname
 import numpy as np
 import soundfile as sf
-
-BAR_START_TICK = 0.0
-BEATS_PER_BAR = 4.0
-BEAT_TYPE = 4.0
-TICKS_PER_BEAT = 960.0
+import jack
+from fractions import Fraction
+from concurrent.futures import ThreadPoolExecutor
 
 
 class Gui(QMainWindow, Ui_MainWindow):
@@ -71,15 +72,23 @@ class Gui(QMainWindow, Ui_MainWindow):
                    Clip.PREPARE_RECORD: True,
                    Clip.RECORDING: False}
 
+    LAUNCH_QUANTIZE = [('Loop', Clip.LAUNCH_LOOP),
+                       ('Immediate', Clip.LAUNCH_NONE),
+                       ('Beat', Clip.LAUNCH_BEAT),
+                       ('1 Bar', 1),
+                       ('2 Bars', 2),
+                       ('4 Bars', 4),
+                       ('8 Bars', 8)]
+
     BLINK_DURATION = 200
-    PROGRESS_PERIOD = 300
+    POLL_PERIOD = 40
 
     ADD_PORT_LABEL = 'Add new Port...'
 
-    updateUi = pyqtSignal()
-    readQueueIn = pyqtSignal()
     updatePorts = pyqtSignal()
     songLoad = pyqtSignal()
+    saveProgress = pyqtSignal(int, int, str)
+    saveDone = pyqtSignal()
 
     def __init__(self, song, jack_client):
         QObject.__init__(self)
@@ -88,9 +97,19 @@ class Gui(QMainWindow, Ui_MainWindow):
         self.setupUi(self)
         self.clip_volume.knobRadius = 3
         self.is_learn_device_mode = False
-        self.queue_out, self.queue_in = Queue(), Queue()
-        self.updateUi.connect(self.update)
-        self.readQueueIn.connect(self.readQueue)
+        self.queue_out, self.queue_in = MidiFifo(), MidiFifo()
+        # set once the engine is created, state is polled from it
+        self.engine = None
+        self.engine_state = Snapshot()
+        self.engine_updates = 0
+        self.bbt_text = None
+        # songs are written by one background thread, saving holds the
+        # future, song, snapshot and file name of the running save
+        self.saver = ThreadPoolExecutor(1)
+        self.saving = None
+        # queued even when the save ends before its done callback is added
+        self.saveProgress.connect(self.onSaveProgress, Qt.QueuedConnection)
+        self.saveDone.connect(self.onSaveDone, Qt.QueuedConnection)
         self.current_vol_block = 0
         self.last_clip = None
 
@@ -107,6 +126,23 @@ class Gui(QMainWindow, Ui_MainWindow):
         self.updateDevices()
         self.deviceGroup.triggered.connect(self.onDeviceSelect)
 
+        # launch quantization of scenes and goto
+        self.menuLaunch = self.menubar.addMenu('Launch')
+        self.launchGroup = QActionGroup(self.menuLaunch)
+        for name, quantize in self.LAUNCH_QUANTIZE:
+            action = QAction(name, self.menuLaunch)
+            action.setCheckable(True)
+            action.setData(quantize)
+            self.menuLaunch.addAction(action)
+            self.launchGroup.addAction(action)
+        self.launchGroup.triggered.connect(self.onSongQuantizeChange)
+
+        # save samples raw to have them memory-mapped on load
+        self.actionRawSamples = QAction('Save Raw Samples', self.menuFile)
+        self.actionRawSamples.setCheckable(True)
+        self.menuFile.insertAction(self.actionQuit, self.actionRawSamples)
+        self.actionRawSamples.triggered.connect(self.onRawSamplesChange)
+
         self.settings = QSettings('superboucle', 'session')
         # Qsetting appear to serialize empty lists as @QInvalid
         # which is then read as None :(
@@ -120,7 +156,13 @@ class Gui(QMainWindow, Ui_MainWindow):
                                                 'true') == "true"
 
         # Load song
+        self.song = None
+        # (guard, blocksize) of buffers sent to the engine, see updateGuard()
+        self.guard_sent = None
+        self.bpm_segment = None
         self.port_by_name = {}
+        self.bus_ports = []
+        self.tempo = Tempo()
         self.initUI(song)
 
         self.actionNew.triggered.connect(self.onActionNew)
@@ -146,6 +188,9 @@ class Gui(QMainWindow, Ui_MainWindow):
         self.beat_diviser.valueChanged.connect(self.onBeatDiviserChange)
         self.output.activated.connect(self.onOutputChange)
         self.mute_group.valueChanged.connect(self.onMuteGroupChange)
+        for name, quantize in self.LAUNCH_QUANTIZE:
+            self.launch_quantize.addItem(name, quantize)
+        self.launch_quantize.activated.connect(self.onLaunchQuantizeChange)
         self.frame_offset.valueChanged.connect(self.onFrameOffsetChange)
         self.beat_offset.valueChanged.connect(self.onBeatOffsetChange)
         self.revertButton.clicked.connect(self.onRevertClip)
@@ -158,9 +203,9 @@ class Gui(QMainWindow, Ui_MainWindow):
         self.blktimer.timeout.connect(self.toggleBlinkButton)
         self.blktimer.start(self.BLINK_DURATION)
 
-        self.disptimer = QTimer()
-        self.disptimer.start(self.PROGRESS_PERIOD)
-        self.disptimer.timeout.connect(self.updateProgress)
+        self.polltimer = QTimer()
+        self.polltimer.timeout.connect(self.poll)
+        self.polltimer.start(self.POLL_PERIOD)
 
         self._jack_client.set_timebase_callback(self.timebase_callback)
         self.show()
@@ -179,6 +224,7 @@ class Gui(QMainWindow, Ui_MainWindow):
 
         # first pass without removing old ports
         self.updateJackPorts(song, remove_ports=False)
+        self.updateGuard(song)
         self.song = song
         # second pass with removing
         self.updateJackPorts(song, remove_ports=True)
@@ -188,8 +234,15 @@ class Gui(QMainWindow, Ui_MainWindow):
         self.output.addItems(song.outputsPorts)
         self.output.addItem(Gui.ADD_PORT_LABEL)
         self.master_volume.setValue(song.volume * 256)
+        # the song keeps its tempo map
+        self.bpm.blockSignals(True)
         self.bpm.setValue(song.bpm)
+        self.bpm.blockSignals(False)
         self.beat_per_bar.setValue(song.beat_per_bar)
+        self.updateTempo()
+        for action in self.launchGroup.actions():
+            action.setChecked(action.data() == song.quantize)
+        self.actionRawSamples.setChecked(song.raw_samples)
         for x in range(song.width):
             for y in range(song.height):
                 clip = song.clips_matrix[x][y]
@@ -214,11 +267,21 @@ class Gui(QMainWindow, Ui_MainWindow):
         self._jack_client.transport_locate(0)
 
         self.setEnabled(False)
-        message = QMessageBox(self)
+        message = QProgressDialog("Reading Files, please wait ...", None,
+                                  0, 0, self)
         message.setWindowTitle("Loading ....")
-        message.setText("Reading Files, please wait ...")
+        message.setMinimumDuration(0)
         message.show()
-        self.initUI(load_song_from_file(file_name))
+        QApplication.processEvents()
+
+        def progress(done, total, member):
+            message.setMaximum(total)
+            message.setValue(done)
+            message.setLabelText("Read %s (%s/%s)" % (member, done, total))
+            QApplication.processEvents()
+
+        self.initUI(load_song_from_file(file_name, progress,
+                                        guard=self._jack_client.blocksize))
         message.close()
         self.setEnabled(True)
 
@@ -230,6 +293,8 @@ class Gui(QMainWindow, Ui_MainWindow):
         self.settings.setValue('playlist', self.playlist)
         self.settings.setValue('paths_used', self.paths_used)
         self.settings.setValue('auto_connect', self.auto_connect)
+        # let a running save finish its file
+        self.saver.shutdown()
 
     def onStartStopClicked(self):
         clip = self.sender().parent().parent().clip
@@ -247,15 +312,25 @@ class Gui(QMainWindow, Ui_MainWindow):
             bps = position['beats_per_minute'] / 60
             fps = position['frame_rate']
             size = (1 / bps) * clip.beat_diviser * fps
-            self.song.init_record_buffer(clip, 2, size, fps)
-            # set frame offset based on jack block size
-            clip.frame_offset = self._jack_client.blocksize
-            clip.state = Clip.PREPARE_RECORD
+            self.send(self.startRecord, clip, fps,
+                      self.song.prepareRecord(clip, 2, size))
             self.recordButton.setStyleSheet(self.RECORD_DEFAULT)
+        elif self.engine is not None:
+            # toggled like a pad, on the launch grid of the clip
+            self.engine.send(self.engine.launches.append,
+                             (0, (clip.x, clip.y)))
         else:
             self.song.toggle(clip.x, clip.y)
         self.update()
 
+    def startRecord(self, clip, samplerate, record):
+        '''Swap in the record buffer of clip and arm it'''
+        replaced = self.song.swapRecord(clip, samplerate, *record)
+        # set frame offset based on jack block size
+        clip.frame_offset = self._jack_client.blocksize
+        clip.state = Clip.PREPARE_RECORD
+        return replaced
+
     def onEdit(self):
         self.last_clip = self.sender().parent().parent().clip
         if self.last_clip:
@@ -266,6 +341,7 @@ class Gui(QMainWindow, Ui_MainWindow):
             self.beat_diviser.setValue(self.last_clip.beat_diviser)
             self.output.setCurrentText(self.last_clip.output)
             self.mute_group.setValue(self.last_clip.mute_group)
+            self.setLaunchQuantize(self.last_clip.quantize)
             self.clip_volume.setValue(self.last_clip.volume * 256)
             state, position = self._jack_client.transport_query()
             fps = position['frame_rate']
@@ -290,14 +366,17 @@ class Gui(QMainWindow, Ui_MainWindow):
     def onRevertClip(self):
         if self.last_clip and self.last_clip.audio_file:
             audio_file = self.last_clip.audio_file
-            self.song.data[audio_file] = self.song.data[audio_file][::-1]
+            buffers = self.song.prepareData(
+                self.song.data[audio_file][:, ::-1])
+            self.send(self.song.swapData, audio_file, buffers)
 
     def onNormalizeClip(self):
         if self.last_clip and self.last_clip.audio_file:
             audio_file = self.last_clip.audio_file
-            absolute_val = np.absolute(self.song.data[audio_file])
-            current_level = np.ndarray.max(absolute_val)
-            self.song.data[audio_file][:] *= (1 / current_level)
+            data = self.song.data[audio_file]
+            current_level = np.ndarray.max(np.absolute(data))
+            buffers = self.song.prepareData(data * (1 / current_level))
+            self.send(self.song.swapData, audio_file, buffers)
 
     def onExportClip(self):
         if self.last_clip and self.last_clip.audio_file:
@@ -307,7 +386,7 @@ class Gui(QMainWindow, Ui_MainWindow):
 
             if file_name:
                 file_name = verify_ext(file_name, 'wav')
-                sf.write(self.song.data[audio_file], file_name,
+                sf.write(self.song.data[audio_file].T, file_name,
                          self.song.samplerate[audio_file],
                          subtype=sf.default_subtype('WAV'),
                          format='WAV')
@@ -320,25 +399,59 @@ class Gui(QMainWindow, Ui_MainWindow):
                                              "to delete the clip ?"))
             if response == QMessageBox.Yes:
                 self.frame_clip.setEnabled(False)
-                self.song.removeClip(self.last_clip)
-                self.initUI(self.song)
+                clip, self.last_clip = self.last_clip, None
+                self.send(self.song.removeClip, clip)
+                # the cell is emptied now, its state once the clip is gone
+                cell = self.btn_matrix[clip.x][clip.y]
+                cell.close()
+                cell.setParent(None)
+                cell = Cell(self, None, clip.x, clip.y)
+                self.btn_matrix[clip.x][clip.y] = cell
+                self.gridLayout.addWidget(cell, clip.y, clip.x)
 
     def onMasterVolumeChange(self):
-        self.song.volume = (self.master_volume.value() / 256)
+        self.send(setattr, self.song, 'volume',
+                  self.master_volume.value() / 256)
 
     def onBpmChange(self):
-        self.song.bpm = self.bpm.value()
+        '''Change tempo from the transport position, a few blocks ahead
+        when rolling so that the engine has not played past it yet.
+        Stopped, the tempo of the segment under the playhead changes.'''
+        state, position = self._jack_client.transport_query()
+        frame = position['frame']
+        if state == jack.ROLLING:
+            frame += 2 * self._jack_client.blocksize
+            self.song.tempo_map.setTempo(
+                frame, self._jack_client.samplerate, self.bpm.value())
+        else:
+            self.song.tempo_map.setSegmentTempo(
+                frame, self._jack_client.samplerate, self.bpm.value())
 
     def onBeatPerBarChange(self):
         self.song.beat_per_bar = self.beat_per_bar.value()
+        self.updateTempo()
+
+    def updateTempo(self):
+        self.song.tempo_map.prepare(self._jack_client.samplerate)
+        self.tempo.set(self.song.tempo_map, self.beat_per_bar.value())
 
     def onGotoClicked(self):
         state, position = self._jack_client.transport_query()
-        new_position = (position['beats_per_bar']
-                        * (self.gotoTarget.value() - 1)
-                        * position['frame_rate']
-                        * (60 / position['beats_per_minute']))
-        self._jack_client.transport_locate(int(round(new_position, 0)))
+        beat = position['beats_per_bar'] * (self.gotoTarget.value() - 1)
+        new_position = self.song.tempo_map.frame(
+            Fraction(beat), position['frame_rate'])
+        new_position = int(round(new_position, 0))
+        if self.engine is None:
+            self._jack_client.transport_locate(new_position)
+        else:
+            self.send(self.engine.queue_locate, self.song, new_position)
+
+    def launchScene(self, clip_ids):
+        '''Load scene clips, on the launch grid of the song'''
+        if self.engine is None:
+            self.song.loadSceneClips(clip_ids)
+        else:
+            self.send(self.engine.queue_scene, self.song, clip_ids)
 
     def onRecord(self):
         self.song.is_record = not self.song.is_record
@@ -364,17 +477,19 @@ class Gui(QMainWindow, Ui_MainWindow):
         cell.clip_name.setText(self.last_clip.name)
 
     def onClipVolumeChange(self):
-        self.last_clip.volume = (self.clip_volume.value() / 256)
+        self.send(setattr, self.last_clip, 'volume',
+                  self.clip_volume.value() / 256)
 
     def onBeatDiviserChange(self):
-        self.last_clip.beat_diviser = self.beat_diviser.value()
+        self.send(setattr, self.last_clip, 'beat_diviser',
+                  self.beat_diviser.value())
 
     def onOutputChange(self):
         new_port = self.output.currentText()
         if new_port == Gui.ADD_PORT_LABEL:
             AddPortDialog(self)
         else:
-            self.last_clip.output = new_port
+            self.send(setattr, self.last_clip, 'output', new_port)
 
     def addPort(self, name):
         self.song.outputsPorts.add(name)
@@ -382,7 +497,7 @@ class Gui(QMainWindow, Ui_MainWindow):
         if self.output.findText(name) == -1:
             self.output.insertItem(self.output.count() - 1, name)
         if self.last_clip:
-            self.last_clip.output = name
+            self.send(setattr, self.last_clip, 'output', name)
             self.output.setCurrentText(name)
 
     def removePort(self, name):
@@ -390,11 +505,13 @@ class Gui(QMainWindow, Ui_MainWindow):
             self.song.outputsPorts.remove(name)
             for c in self.song.clips:
                 if c.output == name:
-                    c.output = Clip.DEFAULT_OUTPUT
+                    self.send(setattr, c, 'output', Clip.DEFAULT_OUTPUT)
             self.updateJackPorts(self.song)
             self.output.removeItem(self.output.findText(name))
             if self.last_clip:
-                self.output.setCurrentText(self.last_clip.output)
+                output = self.last_clip.output
+                self.output.setCurrentText(Clip.DEFAULT_OUTPUT
+                                           if output == name else output)
 
     def updateJackPorts(self, song, remove_ports=True):
         '''Update jack port based on clip output settings
@@ -428,16 +545,65 @@ class Gui(QMainWindow, Ui_MainWindow):
         self.port_by_name = {port.shortname: port
                              for port in self._jack_client.outports}
 
+        # port pairs by bus number, see ClipTable.bus
+        for port_basename in song.outputsPorts:
+            song.table.busIndex(port_basename)
+        self.bus_ports = [[self.port_by_name.get(
+            Song.CHANNEL_NAME_PATTERN.format(port=name, channel=ch))
+            for ch in Song.CHANNEL_NAMES]
+            for name in song.table.outputs]
+
         self.updatePorts.emit()
 
     def onMuteGroupChange(self):
-        self.last_clip.mute_group = self.mute_group.value()
+        self.send(setattr, self.last_clip, 'mute_group',
+                  self.mute_group.value())
+
+    def setLaunchQuantize(self, quantize):
+        index = self.launch_quantize.findData(quantize)
+        if index == -1:
+            self.launch_quantize.addItem('%s Bars' % quantize, quantize)
+            index = self.launch_quantize.count() - 1
+        self.launch_quantize.setCurrentIndex(index)
+
+    def onLaunchQuantizeChange(self):
+        self.send(setattr, self.last_clip, 'quantize',
+                  self.launch_quantize.currentData())
+
+    def onSongQuantizeChange(self, action):
+        self.song.quantize = action.data()
+
+    def onRawSamplesChange(self, checked):
+        self.song.raw_samples = checked
 
     def onFrameOffsetChange(self):
-        self.last_clip.frame_offset = self.frame_offset.value()
+        self.send(setattr, self.last_clip, 'frame_offset',
+                  self.frame_offset.value())
 
     def onBeatOffsetChange(self):
-        self.last_clip.beat_offset = self.beat_offset.value()
+        self.send(setattr, self.last_clip, 'beat_offset',
+                  self.beat_offset.value())
+
+    def updateGuard(self, song):
+        '''Pad song audio for the JACK blocksize, the engine plays audio
+        padded for smaller blocks only once the new buffers are sent'''
+        blocksize = self._jack_client.blocksize
+        if song.guard == blocksize:
+            return
+        if song is not self.song:
+            song.setGuard(blocksize)
+        elif self.guard_sent != (song.guard, blocksize):
+            self.guard_sent = song.guard, blocksize
+            self.send(song.swapGuard, blocksize,
+                      song.prepareGuard(blocksize))
+
+    def send(self, function, *args):
+        '''Change song or clips with function(*args) between two engine
+        cycles, or right away when there is no engine'''
+        if self.engine is None:
+            function(*args)
+        else:
+            self.engine.send(function, *args)
 
     def onActionNew(self):
         NewSongDialog(self)
@@ -464,7 +630,7 @@ class Gui(QMainWindow, Ui_MainWindow):
 
     def onActionSave(self):
         if self.song.file_name:
-            self.song.save()
+            self.saveSong(self.song.file_name)
         else:
             self.onActionSaveAs()
 
@@ -474,9 +640,41 @@ class Gui(QMainWindow, Ui_MainWindow):
 
         if file_name:
             file_name = verify_ext(file_name, 'sbs')
-            self.song.file_name = file_name
-            self.song.save()
-            print("File saved to : {}".format(self.song.file_name))
+            self.saveSong(file_name)
+
+    def saveSong(self, file_name):
+        '''Write the song to file_name in the background, from a snapshot
+        so that it can still be played and changed'''
+        if self.saving is not None:
+            self.statusbar.showMessage("Already saving {}"
+                                       .format(self.saving[3]))
+            return
+        snapshot = self.song.snapshot()
+        future = self.saver.submit(snapshot.write, file_name,
+                                   self.saveProgress.emit)
+        self.saving = future, self.song, snapshot, file_name
+        self.statusbar.showMessage("Saving {} ...".format(file_name))
+        future.add_done_callback(lambda future: self.saveDone.emit())
+
+    def onSaveProgress(self, done, total, member):
+        if self.saving is not None:
+            self.statusbar.showMessage("Saving {} ({}/{}) ..."
+                                       .format(self.saving[3], done, total))
+
+    def onSaveDone(self):
+        future, song, snapshot, file_name = self.saving
+        self.saving = None
+        error = future.exception()
+        if error is not None:
+            song.dirty |= snapshot.dirty
+            self.statusbar.showMessage("Could not save {}: {}"
+                                       .format(file_name, error))
+            return
+        song.file_name = file_name
+        if song is self.song:
+            self.setWindowTitle("Super Boucle - {}".format(file_name))
+        self.statusbar.showMessage("Saved {}".format(file_name), 5000)
+        print("File saved to : {}".format(file_name))
 
     def onAddDevice(self):
         self.learn_device = LearnDialog(self, self.addDevice)
@@ -529,18 +727,14 @@ class Gui(QMainWindow, Ui_MainWindow):
         self.update()
 
     def readQueue(self):
-        try:
-            while True:
-                note = self.queue_in.get(block=False)
-                if len(note) == 3:
-                    status, pitch, vel = struct.unpack('3B', note)
-                    channel = status & 0xF
-                    msg_type = status >> 4
-                    self.processNote(msg_type, channel, pitch, vel)
-                    # else:
-                    # print("Invalid message length")
-        except Empty:
-            pass
+        for offset, note in self.queue_in:
+            if len(note) == 3:
+                status, pitch, vel = struct.unpack('3B', note)
+                channel = status & 0xF
+                msg_type = status >> 4
+                self.processNote(msg_type, channel, pitch, vel)
+                # else:
+                # print("Invalid message length")
 
     def processNote(self, msg_type, channel, pitch, vel):
 
@@ -573,9 +767,9 @@ class Gui(QMainWindow, Ui_MainWindow):
                         [ctrl_index]
                         [self.current_vol_block])
                 if clip:
-                    clip.volume = vel / 127
+                    self.send(setattr, clip, 'volume', vel / 127)
                     if self.last_clip == clip:
-                        self.clip_volume.setValue(self.last_clip.volume * 256)
+                        self.clip_volume.setValue(vel / 127 * 256)
             except KeyError:
                 pass
         elif (btn_id in self.device.scene_buttons
@@ -586,7 +780,7 @@ class Gui(QMainWindow, Ui_MainWindow):
                 scene_id = self.device.scene_buttons.index(btn_id_vel)
 
             try:
-                self.song.loadSceneId(scene_id)
+                self.launchScene(list(self.song.scenes.values())[scene_id])
                 self.update()
             except IndexError:
                 print('cannot load scene {} - there are only {} scenes.'
@@ -640,25 +834,59 @@ class Gui(QMainWindow, Ui_MainWindow):
 
         self.blktimer.state = not self.blktimer.state
 
-    def updateProgress(self):
-        state, pos = self._jack_client.transport_query()
-        if 'bar' in pos:
-            bbt = "%d|%d|%03d" % (pos['bar'], pos['beat'], pos['tick'])
+    def poll(self):
+        '''Read MIDI from the engine and show its last published state'''
+        if self.is_learn_device_mode:
+            self.learn_device.update()
+        else:
+            self.readQueue()
+        if self.engine is None:
+            return
+        self.engine.released.clear()
+        self.updateGuard(self.song)
+        state = self.engine_state
+        self.engine.read_state(state)
+        if state.updates != self.engine_updates:
+            self.engine_updates = state.updates
+            self.update()
+        self.updateProgress(state)
+        self.updateBpm(state)
+
+    def updateBpm(self, state):
+        '''Show the tempo of the segment under the playhead when the
+        playhead enters it'''
+        if not state.frame_rate:
+            return
+        segment = self.song.tempo_map.segment(state.frame, state.frame_rate)
+        if (segment.beat, segment.bpm) != self.bpm_segment:
+            self.bpm_segment = segment.beat, segment.bpm
+            self.bpm.blockSignals(True)
+            self.bpm.setValue(segment.bpm)
+            self.bpm.blockSignals(False)
+
+    def updateProgress(self, state):
+        if state.bbt is not None:
+            bbt = "%d|%d|%03d" % state.bbt
         else:
             bbt = "-|-|-"
-        seconds = int(pos['frame'] / pos['frame_rate'])
+        seconds = 0
+        if state.frame_rate:
+            seconds = int(state.frame / state.frame_rate)
         (minutes, second) = divmod(seconds, 60)
         (hour, minute) = divmod(minutes, 60)
         time = "%d:%02d:%02d" % (hour, minute, second)
-        self.bbtLabel.setText("%s\n%s" % (bbt, time))
-        for line in self.btn_matrix:
-            for btn in line:
-                if btn.clip and btn.clip.audio_file:
-                    value = ((btn.clip.last_offset
-                              / self.song.length(btn.clip))
-                             * 97)
+        text = "%s\n%s" % (bbt, time)
+        if text != self.bbt_text:
+            self.bbt_text = text
+            self.bbtLabel.setText(text)
+        clips = self.song.clips[:state.count]
+        for clip, offset in zip(clips, state.last_offsets):
+            length = self.song.length(clip)
+            if length:
+                btn = self.btn_matrix[clip.x][clip.y]
+                value = int(offset / length * 97)
+                if value != btn.clip_position.value():
                     btn.clip_position.setValue(value)
-                    btn.clip_position.repaint()
 
     def updateDevices(self):
         for action in self.deviceGroup.actions():
@@ -689,17 +917,5 @@ class Gui(QMainWindow, Ui_MainWindow):
     def timebase_callback(self, state, nframes, pos, new_pos):
         if pos.frame_rate == 0:
             return None
-        pos.valid = 0x10
-        pos.bar_start_tick = BAR_START_TICK
-        pos.beats_per_bar = self.beat_per_bar.value()
-        pos.beat_type = BEAT_TYPE
-        pos.ticks_per_beat = TICKS_PER_BEAT
-        pos.beats_per_minute = self.bpm.value()
-        ticks_per_second = (pos.beats_per_minute *
-                            pos.ticks_per_beat) / 60
-        ticks = (ticks_per_second * pos.frame) / pos.frame_rate
-        (beats, pos.tick) = divmod(int(round(ticks, 0)),
-                                   int(round(pos.ticks_per_beat, 0)))
-        (bar, beat) = divmod(beats, int(round(pos.beats_per_bar, 0)))
-        (pos.bar, pos.beat) = (bar + 1, beat + 1)
+        self.tempo.fill(pos)
         return None
@@ -157,6 +157,9 @@ class Ui_MainWindow(object):
         self.mute_group = QtWidgets.QSpinBox(self.groupBox)
         self.mute_group.setGeometry(QtCore.QRect(10, 25, 43, 23))
         self.mute_group.setObjectName("mute_group")
+        self.launch_quantize = QtWidgets.QComboBox(self.groupBox)
+        self.launch_quantize.setGeometry(QtCore.QRect(70, 25, 111, 23))
+        self.launch_quantize.setObjectName("launch_quantize")
         self.groupBox_2 = QtWidgets.QGroupBox(self.frame_clip)
         self.groupBox_2.setGeometry(QtCore.QRect(10, 140, 191, 91))
         font = QtGui.QFont()
@@ -417,7 +420,7 @@ class Ui_MainWindow(object):
         self.exportButton.setText(_translate("MainWindow", "Export Sample"))
         self.normalizeButton.setText(_translate("MainWindow", "Normalize"))
         self.revertButton.setText(_translate("MainWindow", "Revert"))
-        self.groupBox.setTitle(_translate("MainWindow", "Mute Group"))
+        self.groupBox.setTitle(_translate("MainWindow", "Mute Group / Launch"))
         self.groupBox_2.setTitle(_translate("MainWindow", "Clip Offset"))
         self.label_2.setText(_translate("MainWindow", "Sample"))
         self.label.setText(_translate("MainWindow", "Beat"))
@@ -316,6 +316,9 @@ STARTING = _lib.JackTransportStarting
 NETSTARTING = _lib.JackTransportNetStarting
 """Waiting for sync ready on the network."""
 
+POSITION_BBT = _lib.JackPositionBBT
+"""Bar, beat and tick fields of a position struct are valid."""
+
 CALL_AGAIN = 0
 """Possible return value for process callback."""
 STOP_CALLING = 1
@@ -732,7 +735,7 @@ class Client(object):
         state, pos = self.transport_query_struct()
         return TransportState(state), position2dict(pos)
 
-    def transport_query_struct(self):
+    def transport_query_struct(self, position=None):
         """Query the current transport state and position.
 
         This function is realtime-safe, and can be called from any
@@ -740,6 +743,18 @@ class Client(object):
         position corresponds to the first frame of the current cycle and
         the state returned is valid for the entire cycle.
 
+        Nothing is allocated: the position is written in a structure
+        owned by the client, or in `position`.  As the structure owned
+        by the client is reused by :meth:`transport_query` too, a
+        thread querying the transport while others may do so (e.g. the
+        process callback) should pass its own structure.
+
+        Parameters
+        ----------
+        position : jack_position_t, optional
+            Structure created with :func:`position_struct`, to be
+            filled and returned.
+
         Returns
         -------
         state : int
@@ -758,8 +773,10 @@ class Client(object):
         transport_query
 
         """
-        state = _lib.jack_transport_query(self._ptr, self._position)
-        return state, self._position
+        if position is None:
+            position = self._position
+        state = _lib.jack_transport_query(self._ptr, position)
+        return state, position
 
     def set_freewheel(self, onoff):
         """Start/Stop JACK's "freewheel" mode.
@@ -1653,6 +1670,9 @@ class OwnPort(Port):
     def __init__(self, port_ptr, client):
         Port.__init__(self, port_ptr)
         self._client = client
+        # see get_array()
+        self._array = None
+        self._array_ptr = _ffi.NULL
 
     @property
     def number_of_connections(self):
@@ -1769,19 +1789,38 @@ class OwnPort(Port):
         return _ffi.buffer(_lib.jack_port_get_buffer(self._ptr, blocksize),
                            blocksize * _ffi.sizeof("float"))
 
-    def get_array(self):
+    def get_array(self, blocksize=None):
         """Get audio buffer as NumPy array.
 
         Make sure to ``import numpy`` before calling this, otherwise the
         first call might take a long time.
 
+        The array is cached with the buffer address: the same array is
+        returned as long as JACK gives the same memory area for the
+        same blocksize.
+
+        Parameters
+        ----------
+        blocksize : int, optional
+            The current blocksize, e.g. the argument of the process
+            callback.  If not given, it is queried from JACK.
+
         See Also
         --------
-        get_buffer
+        get_buffer, Ports.get_arrays
 
         """
-        import numpy as np
-        return np.frombuffer(self.get_buffer(), dtype=np.float32)
+        if blocksize is None:
+            blocksize = self._client.blocksize
+        ptr = _lib.jack_port_get_buffer(self._ptr, blocksize)
+        array = self._array
+        if ptr != self._array_ptr or len(array) != blocksize:
+            import numpy as np
+            array = np.frombuffer(
+                _ffi.buffer(ptr, blocksize * _ffi.sizeof("float")),
+                dtype=np.float32)
+            self._array, self._array_ptr = array, ptr
+        return array
 
 
 class OwnMidiPort(MidiPort, OwnPort):
@@ -1807,6 +1846,10 @@ class OwnMidiPort(MidiPort, OwnPort):
     def __init__(self, *args, **kwargs):
         OwnPort.__init__(self, *args, **kwargs)
         self._event = _ffi.new("jack_midi_event_t*")
+        # types of read_midi_events(), resolved before the first cycle
+        self._record_type = _ffi.typeof("unsigned char*")
+        self._time_size = _ffi.sizeof("jack_nframes_t")
+        self.skipped_events = 0
 
     def get_buffer(self):
         """Not available for MIDI ports."""
@@ -1864,6 +1907,51 @@ class OwnMidiPort(MidiPort, OwnPort):
             assert not err, err
             yield event.time, _ffi.buffer(event.buffer, event.size)
 
+    def read_midi_events(self, events):
+        """Read incoming MIDI events into a NumPy array.
+
+        Unlike :meth:`incoming_midi_events`, no object is created per
+        event: time, size and data of each event are copied in place.
+
+        Parameters
+        ----------
+        events : numpy.ndarray
+            Contiguous array created with :func:`midi_event_dtype`.
+            Events longer than its data field and events JACK fails to
+            get are skipped and counted in :attr:`skipped_events`,
+            events after the end of the array are dropped.
+
+        Returns
+        -------
+        int
+            The number of events stored at the start of `events`.
+
+        """
+        event = self._event
+        buf = _lib.jack_port_get_buffer(self._ptr, self._client.blocksize)
+        fields = events.dtype.fields
+        time, size, data = (fields[name][1]
+                            for name in ('time', 'size', 'data'))
+        capacity = events.dtype['data'].shape[0]
+        itemsize = events.dtype.itemsize
+        record = _ffi.cast(self._record_type, events.ctypes.data)
+        # time is the first field of jack_midi_event_t
+        time_size = self._time_size
+        memmove, event_get = _ffi.memmove, _lib.jack_midi_event_get
+        count = 0
+        for i in range(min(_lib.jack_midi_get_event_count(buf),
+                           len(events))):
+            if event_get(event, buf, i) or event.size > capacity:
+                self.skipped_events += 1
+                continue
+            event_size = event.size
+            memmove(record + time, event, time_size)
+            record[size] = event_size
+            memmove(record + data, event.buffer, event_size)
+            record += itemsize
+            count += 1
+        return count
+
     def clear_buffer(self):
         """Clear an event buffer.
 
@@ -1914,6 +2002,36 @@ class OwnMidiPort(MidiPort, OwnPort):
             _lib.jack_port_get_buffer(self._ptr, self._client.blocksize),
             time, event, len(event)), "Error writing MIDI event")
 
+    def write_midi_events(self, events):
+        """Write an array of outgoing MIDI events.
+
+        The same rules as for :meth:`write_midi_event` apply, events
+        must be sorted by time.  Events are written in order until one
+        can't be, for instance when the port buffer is full, nothing is
+        raised so that this can be called from the process callback.
+
+        Parameters
+        ----------
+        events : numpy.ndarray
+            Contiguous array created with :func:`midi_event_dtype`.
+
+        Returns
+        -------
+        int
+            The number of events written, from the start of `events`.
+
+        """
+        buf = _lib.jack_port_get_buffer(self._ptr, self._client.blocksize)
+        sizes = events['size'].tolist()
+        itemsize = events.dtype.itemsize
+        data = (_ffi.cast(self._record_type, events.ctypes.data)
+                + events.dtype.fields['data'][1])
+        event_write = _lib.jack_midi_event_write
+        for i, time in enumerate(events['time'].tolist()):
+            if event_write(buf, time, data + i * itemsize, sizes[i]):
+                return i
+        return len(events)
+
     def reserve_midi_event(self, time, size):
         """Get a buffer where an outgoing MIDI event can be written to.
 
@@ -1982,6 +2100,22 @@ class Ports(object):
     def __repr__(self):
         return self._portlist.__repr__()
 
+    def get_arrays(self, blocksize=None):
+        """Get the audio buffers of all ports as NumPy arrays.
+
+        The blocksize is only queried once for all ports if not given,
+        see :meth:`OwnPort.get_array`.
+
+        Returns
+        -------
+        list of numpy.ndarray
+            One array per port, in port order.
+
+        """
+        if blocksize is None:
+            blocksize = self._client.blocksize
+        return [port.get_array(blocksize) for port in self._portlist]
+
     def register(self, shortname, is_terminal=False, is_physical=False):
         """Create a new input/output port.
 
@@ -2071,6 +2205,8 @@ class RingBuffer(object):
         if not ptr:
             raise JackError("Could not create RingBuffer")
         self._ptr = _ffi.gc(ptr, _lib.jack_ringbuffer_free)
+        # for read_into() and write_from()
+        self._vectors = _ffi.new("jack_ringbuffer_data_t[2]")
 
     @property
     def write_space(self):
@@ -2131,6 +2267,42 @@ class RingBuffer(object):
             _ffi.buffer(vectors[1].buf, vectors[1].len)
         )
 
+    def write_from(self, array):
+        """Write the items of a NumPy array into the ringbuffer.
+
+        Unlike :meth:`write`, data is copied from the array memory
+        straight to the two parts of :attr:`write_buffers`, without
+        creating any buffer object.
+
+        Parameters
+        ----------
+        array : numpy.ndarray
+            C-contiguous array.  Only whole items are written, as many
+            as there is space for, starting from the first one.
+
+        Returns
+        -------
+        int
+            The number of items written.
+
+        See Also
+        --------
+        read_into
+
+        """
+        itemsize = array.itemsize
+        size = min(array.nbytes, _lib.jack_ringbuffer_write_space(self._ptr))
+        size -= size % itemsize
+        vectors = self._vectors
+        _lib.jack_ringbuffer_get_write_vector(self._ptr, vectors)
+        source = _ffi.from_buffer(array)
+        first = min(size, vectors[0].len)
+        _ffi.memmove(vectors[0].buf, source, first)
+        if size > first:
+            _ffi.memmove(vectors[1].buf, source + first, size - first)
+        _lib.jack_ringbuffer_write_advance(self._ptr, size)
+        return size // itemsize
+
     def write_advance(self, size):
         """Advance the write pointer.
 
@@ -2231,6 +2403,63 @@ class RingBuffer(object):
             _ffi.buffer(vectors[1].buf, vectors[1].len)
         )
 
+    def read_into(self, array):
+        """Read data from the ringbuffer into a NumPy array.
+
+        Unlike :meth:`read`, data is copied from the two parts of
+        :attr:`read_buffers` straight to the array memory, without
+        creating any buffer object.
+
+        Parameters
+        ----------
+        array : numpy.ndarray
+            Writable C-contiguous array.  Only whole items are read, as
+            many as available and fitting in the array, from its start.
+
+        Returns
+        -------
+        int
+            The number of items read.
+
+        See Also
+        --------
+        write_from, peek_into
+
+        """
+        count = self.peek_into(array)
+        _lib.jack_ringbuffer_read_advance(self._ptr, count * array.itemsize)
+        return count
+
+    def peek_into(self, array):
+        """Copy data from the ringbuffer into a NumPy array.
+
+        Like :meth:`read_into`, but the read pointer is not moved: use
+        :meth:`read_advance` with the size of the items consumed.
+
+        Parameters
+        ----------
+        array : numpy.ndarray
+            Writable C-contiguous array.  Only whole items are copied, as
+            many as available and fitting in the array, from its start.
+
+        Returns
+        -------
+        int
+            The number of items copied.
+
+        """
+        itemsize = array.itemsize
+        size = min(array.nbytes, _lib.jack_ringbuffer_read_space(self._ptr))
+        size -= size % itemsize
+        vectors = self._vectors
+        _lib.jack_ringbuffer_get_read_vector(self._ptr, vectors)
+        destination = _ffi.from_buffer(array)
+        first = min(size, vectors[0].len)
+        _ffi.memmove(destination, vectors[0].buf, first)
+        if size > first:
+            _ffi.memmove(destination + first, vectors[1].buf, size - first)
+        return size // itemsize
+
     def read_advance(self, size):
         """Advance the read pointer.
 
@@ -2458,6 +2687,28 @@ def position2dict(pos):
     return dict((k, getattr(pos, k)) for k in keys)
 
 
+def midi_event_dtype(size=3):
+    """NumPy dtype of the arrays of :meth:`OwnMidiPort.read_midi_events`.
+
+    Each event is a packed record of its time (uint32), its size (uint8)
+    and `size` bytes of data, of which only the first size are used.
+
+    """
+    import numpy as np
+    return np.dtype([('time', np.uint32), ('size', np.uint8),
+                     ('data', np.uint8, (size,))])
+
+
+def position_struct():
+    """Create a position structure for :meth:`Client.transport_query_struct`.
+
+    Fields are read as attributes, e.g. ``position.frame``. Check
+    ``position.valid & POSITION_BBT`` before reading BBT fields.
+
+    """
+    return _ffi.new("jack_position_t*")
+
+
 def version():
     """Get tuple of major/minor/micro/protocol version."""
     major_ptr = _ffi.new("int*")
@@ -1,11 +1,10 @@
 from PyQt5.QtWidgets import QDialog, QWidget, QMessageBox
-from PyQt5.QtCore import pyqtSignal
 import struct
 from copy import deepcopy
-from queue import Queue, Empty
 from learn_cell_ui import Ui_LearnCell
 from learn_ui import Ui_Dialog
 from device import Device
+from fifo import MidiFifo
 import re
 
 _init_cmd_regexp = re.compile("^\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*$")
@@ -48,14 +47,12 @@ class LearnDialog(QDialog, Ui_Dialog):
     RECORD_BTN = 8
     SCENES_BTN = 9
 
-    updateUi = pyqtSignal()
-
     def __init__(self, parent, callback, device=None):
         super(LearnDialog, self).__init__(parent)
         self.gui = parent
         self.setupUi(self)
         self.callback = callback
-        self.queue = Queue()
+        self.queue = MidiFifo()
         if device is None:
             self.original_device = Device()
         else:
@@ -72,7 +69,6 @@ class LearnDialog(QDialog, Ui_Dialog):
         self.knownBtn = set()
         self.block_bts_list = []
         self.send_midi_to = None
-        self.updateUi.connect(self.update)
 
         # set current device values
         self.name.setText(self.device.name)
@@ -266,14 +262,10 @@ class LearnDialog(QDialog, Ui_Dialog):
             self.gui.queue_out.put(note)
 
     def update(self):
-        try:
-            while True:
-                data = self.queue.get(block=False)
-                if len(data) == 3:
-                    status, pitch, vel = struct.unpack('3B', data)
-                    self.processNote(status, pitch, vel)
-        except Empty:
-            pass
+        for offset, data in self.queue:
+            if len(data) == 3:
+                status, pitch, vel = struct.unpack('3B', data)
+                self.processNote(status, pitch, vel)
 
     def processNote(self, status, pitch, velocity):
 
@@ -54,7 +54,7 @@ class PortManager(QDialog, Ui_Dialog):
         for tp in zip(self.gui.song.clips_matrix, data["clips"]):
             for (clip, out) in zip(*tp):
                 if isinstance(clip, Clip):
-                    clip.output = out
+                    self.gui.send(setattr, clip, 'output', out)
         self.gui.updatePorts.emit()
 
     def onSavePortlist(self):
@@ -117,6 +117,6 @@ class SceneManager(QDialog, Ui_Dialog):
 
     def loadScene(self, scene):
         try:
-            self.gui.song.loadScene(scene)
+            self.gui.launchScene(self.gui.song.scenes[scene])
         except:
             pass
@@ -0,0 +1,148 @@
+"""Tempo map of a song, with frame to beat lookups for the JACK thread."""
+
+import jack
+from bisect import bisect_right
+from fractions import Fraction
+from math import ceil
+
+# bpm is rounded to 1 / BPM_PRECISION for exact tick computation
+BPM_PRECISION = 100
+
+BAR_START_TICK = 0.0
+BEATS_PER_BAR = 4.0
+BEAT_TYPE = 4.0
+TICKS_PER_BEAT = 960.0
+
+
+class Segment():
+    '''Part of a tempo map at constant tempo, for one frame rate.
+
+    Beats of the segment are exact: frame starts at beat, as a Fraction.
+    Engine ticks are 1 / numerator of the bpm fraction of a frame, beat b
+    is at tick b * ticks_per_beat and frame f at tick f * ticks + tick_base.
+    Rounded BBT ticks at frame f are (f * bbt_rate + bbt_base) // bbt_den.
+    '''
+
+    def __init__(self, beat, bpm, frame, frame_rate):
+        self.beat, self.bpm, self.frame = beat, bpm, frame
+        self.tempo = Fraction(bpm).limit_denominator(BPM_PRECISION)
+        # first frame of the segment
+        self.start = ceil(frame)
+        self.ticks = self.tempo.numerator
+        self.ticks_per_beat = 60 * frame_rate * self.tempo.denominator
+        self.tick_base = round(beat * self.ticks_per_beat
+                               - frame * self.ticks)
+        rate = self.tempo * int(TICKS_PER_BEAT) / (60 * frame_rate)
+        base = beat * int(TICKS_PER_BEAT) - frame * rate
+        denominator = rate.denominator * base.denominator
+        self.bbt_rate = int(2 * rate * denominator)
+        self.bbt_base = int(2 * base * denominator) + denominator
+        self.bbt_den = 2 * denominator
+
+
+class TempoMap():
+    '''Tempo changes of a song, as (beat, bpm) points from beat 0.
+
+    Frames are found from beats through a timeline of segments computed
+    for one frame rate. Changes build a new timeline and swap it in as a
+    whole, so lookups from the JACK thread only do a binary search.
+    '''
+
+    def __init__(self, bpm=120, points=None):
+        if not points:
+            points = [(Fraction(0), bpm)]
+        # points, frame rate, segment start frames, segments
+        self.timeline = (tuple(points), None, [], [])
+
+    @property
+    def points(self):
+        return self.timeline[0]
+
+    @staticmethod
+    def build(points, frame_rate):
+        starts, segments = [], []
+        frame, segment = Fraction(0), None
+        for beat, bpm in points:
+            if segment is not None:
+                frame += ((beat - segment.beat) * 60 * frame_rate
+                          / segment.tempo)
+            segment = Segment(Fraction(beat), bpm, frame, frame_rate)
+            starts.append(segment.start)
+            segments.append(segment)
+        return tuple(points), frame_rate, starts, segments
+
+    def prepare(self, frame_rate):
+        '''Compute the timeline of frame_rate, if not done yet'''
+        points, timeline_rate, starts, segments = self.timeline
+        if timeline_rate != frame_rate:
+            self.timeline = self.build(points, frame_rate)
+
+    def segment(self, frame, frame_rate):
+        '''Return the segment of the tempo map at frame'''
+        points, timeline_rate, starts, segments = self.timeline
+        if timeline_rate != frame_rate:
+            self.prepare(frame_rate)
+            points, timeline_rate, starts, segments = self.timeline
+        return segments[bisect_right(starts, frame) - 1]
+
+    def beat(self, frame, frame_rate):
+        '''Return the beat at frame, as a Fraction'''
+        segment = self.segment(frame, frame_rate)
+        return (segment.beat + (frame - segment.frame) * segment.tempo
+                / (60 * frame_rate))
+
+    def frame(self, beat, frame_rate):
+        '''Return the frame of beat, as a Fraction'''
+        self.prepare(frame_rate)
+        points, timeline_rate, starts, segments = self.timeline
+        index = bisect_right([point[0] for point in points], beat) - 1
+        segment = segments[max(index, 0)]
+        return (segment.frame + (beat - segment.beat) * 60 * frame_rate
+                / segment.tempo)
+
+    def setTempo(self, frame, frame_rate, bpm):
+        '''Change tempo from frame on, later changes are dropped'''
+        beat = self.beat(frame, frame_rate)
+        points = [point for point in self.points if point[0] < beat]
+        if not points or points[-1][1] != bpm:
+            points.append((beat, bpm))
+        self.timeline = self.build(points, frame_rate)
+
+    def setSegmentTempo(self, frame, frame_rate, bpm):
+        '''Change tempo of the segment at frame, later changes are kept'''
+        points = list(self.points)
+        beat = self.segment(frame, frame_rate).beat
+        index = [point[0] for point in points].index(beat)
+        points[index] = (points[index][0], bpm)
+        self.timeline = self.build(points, frame_rate)
+
+
+class Tempo():
+    '''Tempo map and meter read by the JACK timebase callback.
+
+    The GUI calls set() when the song or meter change, which swaps in one
+    tuple, so fill() does not touch Qt and finds bar, beat and tick with a
+    binary search and a few integer operations.
+    '''
+
+    def __init__(self, tempo_map=None, beats_per_bar=4):
+        self.set(tempo_map or TempoMap(), beats_per_bar)
+
+    def set(self, tempo_map, beats_per_bar):
+        self.state = (tempo_map, int(beats_per_bar))
+
+    def fill(self, pos):
+        '''Write BBT fields of a jack_position_t for pos.frame'''
+        tempo_map, beats_per_bar = self.state
+        segment = tempo_map.segment(pos.frame, pos.frame_rate)
+        pos.valid = jack.POSITION_BBT
+        pos.bar_start_tick = BAR_START_TICK
+        pos.beats_per_bar = beats_per_bar
+        pos.beat_type = BEAT_TYPE
+        pos.ticks_per_beat = TICKS_PER_BEAT
+        pos.beats_per_minute = segment.bpm
+        ticks = ((pos.frame * segment.bbt_rate + segment.bbt_base)
+                 // segment.bbt_den)
+        beats, pos.tick = divmod(ticks, int(TICKS_PER_BEAT))
+        bar, beat = divmod(beats, beats_per_bar)
+        pos.bar, pos.beat = bar + 1, beat + 1
@@ -0,0 +1,286 @@
+"""Engine output against a per-frame model of clip loops.
+
+Engine.process() runs on fake ports and transport, without a JACK server,
+but importing jack still needs the JACK library.
+
+usage: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+from fractions import Fraction
+from math import ceil
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import jack  # noqa: E402
+except OSError:
+    jack = None
+else:
+    from clip import Clip, Song  # noqa: E402
+    from device import Device  # noqa: E402
+    from engine import Engine  # noqa: E402
+
+RATE = 48000
+
+
+class FakeClient():
+    '''Transport of Engine.process(), rolling at frame'''
+
+    def __init__(self):
+        self.frame = 0
+
+    def transport_query_struct(self, position):
+        position.frame = self.frame
+        position.frame_rate = RATE
+        position.valid = jack.POSITION_BBT
+        return jack.ROLLING, position
+
+    def transport_locate(self, frame):
+        self.frame = frame
+
+
+class FakePort():
+    '''Audio or MIDI port, buffer is the audio of the last cycle'''
+
+    def __init__(self):
+        self.buffer = np.zeros(0, dtype=np.float32)
+
+    def get_array(self, frames):
+        if len(self.buffer) != frames:
+            self.buffer = np.zeros(frames, dtype=np.float32)
+        return self.buffer
+
+    def read_midi_events(self, events):
+        return 0
+
+    def clear_buffer(self):
+        pass
+
+    def write_midi_events(self, events):
+        return len(events)
+
+
+class FakeFifo():
+
+    def write(self, events):
+        pass
+
+    def peek(self, events):
+        return 0
+
+    def advance(self, count):
+        pass
+
+
+def make_song(bpm, frames):
+    song = Song(4, 4)
+    song.bpm = bpm
+    song.setGuard(frames)
+    return song
+
+
+def add_clip(song, x, data, **kwargs):
+    '''Add a clip playing (channels x frames) audio data'''
+    audio_file = 'clip-%d.wav' % x
+    song.setData(audio_file, data)
+    song.samplerate[audio_file] = RATE
+    clip = Clip(audio_file, **kwargs)
+    song.addClip(clip, x, 0)
+    return clip
+
+
+def run(song, frames, starts, before=None):
+    '''Return the (channels x frames) output of the first bus for cycles
+    starting at starts. before(engine, cycle, frame) is called before each
+    cycle.'''
+    client = FakeClient()
+    midi_in, midi_out, inL, inR = (FakePort() for i in range(4))
+    gui = SimpleNamespace(song=song, is_learn_device_mode=False,
+                          device=Device(), learn_device=None,
+                          queue_in=FakeFifo(), queue_out=FakeFifo(),
+                          bus_ports=[[FakePort() for ch in Song.CHANNEL_NAMES]
+                                     for name in song.table.outputs])
+    engine = Engine(client, gui, midi_in, midi_out, inL, inR)
+    output = []
+    for cycle, frame in enumerate(starts):
+        client.frame = frame
+        # inputs are their own absolute frame
+        inL.get_array(frames)[:] = np.arange(frame, frame + frames)
+        inR.get_array(frames)[:] = -inL.buffer
+        if before is not None:
+            before(engine, cycle, frame)
+        engine.process(frames)
+        output.append([port.buffer.copy() for port in gui.bus_ports[0]])
+    return np.concatenate(output, axis=1)
+
+
+def beat_frames(bpm):
+    return 60 * RATE / Fraction(str(bpm))
+
+
+def loop(clip, bpm):
+    '''Return the exact period and offset of clip loops, in frames'''
+    beat = beat_frames(bpm)
+    return (clip.beat_diviser * beat,
+            clip.frame_offset + Fraction(str(clip.beat_offset)) * beat)
+
+
+def model(song, bpm, frames, starts, gates=None):
+    '''Reference output of the first bus: each clip is at the frame since
+    its last loop boundary, rounded up to a frame, and silent after the end
+    of its audio. gates maps clips to the first frame they play.'''
+    gates = gates or {}
+    frame = np.concatenate([np.arange(start, start + frames)
+                            for start in starts])
+    output = np.zeros((len(Song.CHANNEL_NAMES), len(frame)))
+    for clip in song.clips:
+        data = song.data[clip.audio_file]
+        period, offset = loop(clip, bpm)
+        # frames since the last boundary at or before frame
+        position = np.array([f - ceil(offset + (f - offset) // period
+                                      * period)
+                             for f in frame.tolist()])
+        audible = ((position < data.shape[1])
+                   & (frame >= gates.get(clip, frame[0])))
+        for channel in range(len(output)):
+            samples = data[channel % len(data)]
+            output[channel, audible] += (samples[position[audible]]
+                                         * clip.volume * song.volume)
+    return output
+
+
+def noise(channels, length, seed):
+    rng = np.random.default_rng(seed)
+    return (rng.random((channels, length)) - 0.5).astype(np.float32)
+
+
+@unittest.skipIf(jack is None, "JACK library not found")
+class TestEngineOutput(unittest.TestCase):
+
+    def assertOutput(self, output, expected):
+        np.testing.assert_allclose(output, expected, rtol=1e-5, atol=1e-6)
+
+    def test_loop_boundaries(self):
+        '''Fractional periods and offsets, audio shorter and longer than
+        the loop, mono audio, and a relocate'''
+        bpm = 437.3
+        for frames in (64, 256, 1000):
+            song = make_song(bpm, frames)
+            for clip in (add_clip(song, 0, noise(2, 15000, 1),
+                                  beat_diviser=2),
+                         add_clip(song, 1, noise(1, 5000, 2), volume=0.5,
+                                  frame_offset=100, beat_offset=0.5),
+                         add_clip(song, 2, noise(2, 7000, 3),
+                                  beat_offset=1.25)):
+                clip.state = Clip.START
+            starts = list(range(0, 40000, frames))
+            starts += list(range(1000003, 1020000, frames))
+            self.assertOutput(run(song, frames, starts),
+                              model(song, bpm, frames, starts))
+
+    def test_short_loops(self):
+        '''Loops shorter than the block wrap several times in it'''
+        bpm = 1234.5
+        for frames in (4096, 8192):
+            song = make_song(bpm, frames)
+            for clip in (add_clip(song, 0, noise(2, 1500, 4)),
+                         add_clip(song, 1, noise(2, 3000, 5),
+                                  frame_offset=37),
+                         add_clip(song, 2, noise(1, 4000, 6),
+                                  beat_diviser=2, beat_offset=0.25)):
+                clip.state = Clip.START
+            starts = list(range(0, 20 * frames, frames))
+            self.assertOutput(run(song, frames, starts),
+                              model(song, bpm, frames, starts))
+
+    def test_quantized_launch(self):
+        '''A pad press starts the clip on the next beat, where it would be
+        in its loop had it been playing'''
+        for bpm, frames, press in ((97.3, 64, 45678), (97.3, 256, 30001),
+                                   (97.3, 1000, 29600), (120, 256, 48000)):
+            beat = beat_frames(bpm)
+            song = make_song(bpm, frames)
+            clip = add_clip(song, 0, noise(2, 70000, 7), beat_diviser=2,
+                            frame_offset=11, quantize=Clip.LAUNCH_BEAT)
+            starts = list(range(0, 90000, frames))
+
+            def before(engine, cycle, frame):
+                if frame <= press < frame + frames:
+                    engine.launches.append((press - frame, (0, 0)))
+
+            launch = ceil(ceil(press / beat) * beat)
+            self.assertOutput(run(song, frames, starts, before),
+                              model(song, bpm, frames, starts,
+                                    {clip: launch}))
+            self.assertEqual(clip.state, Clip.START)
+
+    def test_tempo_change(self):
+        '''Playing clips go on where they are after a tempo change, also
+        with a clip changed in the block of the change, and loop on the
+        new beats from their next boundary'''
+        frames = 256
+        for edit in (False, True):
+            song = make_song(120, frames)
+            # audio is its own position
+            clip = add_clip(song, 0, np.tile(np.arange(40000,
+                                                       dtype=np.float32),
+                                             (2, 1)))
+            clip.state = Clip.START
+            starts = list(range(0, 100000, frames))
+
+            def before(engine, cycle, frame):
+                if cycle == 100:
+                    song.tempo_map.setTempo(frame + 2 * frames, RATE, 90.0)
+                if edit and cycle == 102:
+                    clip.volume = 1.0
+
+            output = run(song, frames, starts, before)[0]
+            restarts = np.flatnonzero(np.diff(output) != 1) + 1
+            np.testing.assert_array_equal(output[restarts], 0)
+            # loops restart on beats of the tempo map
+            expected = [ceil(song.tempo_map.frame(beat, RATE))
+                        for beat in range(1, 4)]
+            np.testing.assert_array_equal(restarts, expected)
+
+    def test_record_offsets(self):
+        '''A clip armed to record starts recording at its first loop
+        boundary, frame offset included, and stops at the next one'''
+        bpm = 437.3
+        size = beat_frames(bpm)
+        for frames, arm in ((64, 5000), (256, 20000), (1000, 7000)):
+            song = make_song(bpm, frames)
+            clip = Clip(None, name='rec')
+            song.addClip(clip, 0, 0)
+            song.init_record_buffer(clip, 2, size, RATE)
+            starts = list(range(0, 50000, frames))
+            armed = []
+
+            def before(engine, cycle, frame):
+                if not armed and frame >= arm:
+                    armed.append(frame)
+                    # as Gui.startRecord()
+                    clip.frame_offset = frames
+                    clip.state = Clip.PREPARE_RECORD
+
+            run(song, frames, starts, before)
+            self.assertEqual(clip.state, Clip.STOP)
+            self.assertEqual(clip.frame_offset, 0)
+            # first boundary at or after the cycle the clip is armed in
+            period, offset = loop(clip, bpm)
+            offset += frames
+            start = ceil(offset + ceil((armed[0] - offset) / period)
+                         * period)
+            recorded = song.data[clip.audio_file]
+            expected = start + np.arange(recorded.shape[1])
+            np.testing.assert_array_equal(recorded[0], expected)
+            np.testing.assert_array_equal(recorded[1], -expected)
+
+
+if __name__ == '__main__':
+    unittest.main()